@@ -1,8 +1,16 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, Response
 from models import get_db
 from auth import admin_required
-from bot_manager import user_bots, get_bot_manager
+from bot_manager import (
+    find_bot_manager, get_bot_manager, get_user_bots, iter_bots, remove_user_bots,
+    stop_bots_async
+)
+from plan_manager import PLANS, invalidate_plan
+import jobs
+import profiling
+import usage
 import json
+import time
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -36,34 +44,30 @@ def suspend_user():
     c = conn.cursor()
     c.execute('UPDATE users SET suspended = ? WHERE id = ?', (1 if suspend else 0, user_id))
     conn.commit()
-    # Force stop all bots of this user
-    if user_id in user_bots:
-        for bot in user_bots[user_id].values():
-            if bot.status == 'RUNNING':
-                bot.stop()
     conn.close()
-    return jsonify({'success': True})
+    # Force stop all bots of this user in the background
+    job_id = None
+    if suspend:
+        job_id = stop_bots_async(get_user_bots(user_id), kind='suspend_user').id
+    return jsonify({'success': True, 'job_id': job_id})
 
 @admin_bp.route('/admin/user/delete', methods=['POST'])
 @admin_required
 def delete_user():
     data = request.json
     user_id = data.get('user_id')
+    # Stop all bots in the background
+    job = stop_bots_async(remove_user_bots(user_id), kind='delete_user')
     conn = get_db()
     c = conn.cursor()
-    # Stop all bots
-    if user_id in user_bots:
-        for bot in user_bots[user_id].values():
-            if bot.status == 'RUNNING':
-                bot.stop()
-        del user_bots[user_id]
     # Delete user's bots from DB
     c.execute('DELETE FROM bots WHERE user_id = ?', (user_id,))
     # Delete user
     c.execute('DELETE FROM users WHERE id = ?', (user_id,))
     conn.commit()
     conn.close()
-    return jsonify({'success': True})
+    invalidate_plan(user_id)
+    return jsonify({'success': True, 'job_id': job.id})
 
 @admin_bp.route('/admin/user/change-plan', methods=['POST'])
 @admin_required
@@ -76,6 +80,7 @@ def change_plan():
     c.execute('UPDATE users SET plan = ? WHERE id = ?', (plan, user_id))
     conn.commit()
     conn.close()
+    invalidate_plan(user_id)
     return jsonify({'success': True})
 
 @admin_bp.route('/admin/bots', methods=['GET'])
@@ -92,13 +97,21 @@ def get_all_bots():
     result = []
     for b in bots:
         bdict = dict(b)
-        if b['user_id'] in user_bots and b['id'] in user_bots[b['user_id']]:
-            bdict['running'] = user_bots[b['user_id']][b['id']].status == 'RUNNING'
-        else:
-            bdict['running'] = False
+        # Bots nobody has loaded yet are reported from their row
+        manager = find_bot_manager(b['user_id'], b['id'])
+        status = manager.status if manager else b['status']
+        bdict['running'] = status == 'RUNNING'
         result.append(bdict)
     return jsonify(result)
 
+def _stoppable_manager(user_id, bot_id, status):
+    """Manager of a bot that may be running; stopped bots aren't loaded."""
+    manager = find_bot_manager(user_id, bot_id)
+    if manager is None and status == 'RUNNING':
+        # e.g. placed on a node and not loaded by this process yet
+        manager = get_bot_manager(user_id, bot_id)
+    return manager
+
 @admin_bp.route('/admin/bot/force-stop', methods=['POST'])
 @admin_required
 def force_stop_bot():
@@ -106,11 +119,11 @@ def force_stop_bot():
     bot_id = data.get('bot_id')
     conn = get_db()
     c = conn.cursor()
-    bot = c.execute('SELECT user_id FROM bots WHERE id = ?', (bot_id,)).fetchone()
+    bot = c.execute('SELECT user_id, status FROM bots WHERE id = ?', (bot_id,)).fetchone()
     if bot:
-        user_id = bot['user_id']
-        if user_id in user_bots and bot_id in user_bots[user_id]:
-            user_bots[user_id][bot_id].stop()
+        manager = _stoppable_manager(bot['user_id'], bot_id, bot['status'])
+        if manager:
+            manager.stop()
     conn.close()
     return jsonify({'success': True})
 
@@ -121,10 +134,205 @@ def system_stats():
     c = conn.cursor()
     total_users = c.execute('SELECT COUNT(*) as cnt FROM users').fetchone()['cnt']
     total_bots = c.execute('SELECT COUNT(*) as cnt FROM bots').fetchone()['cnt']
-    running_bots = sum(1 for u in user_bots for b in user_bots[u] if user_bots[u][b].status == 'RUNNING')
+    bots = iter_bots()
+    running_bots = sum(1 for bot in bots if bot.status == 'RUNNING')
     conn.close()
     return jsonify({
         'total_users': total_users,
         'total_bots': total_bots,
-        'running_bots': running_bots
-    })
\ No newline at end of file
+        'running_bots': running_bots,
+        # Bots killed by a liveness check since they were last started
+        'hung_bots': sum(1 for bot in bots if bot.hang_count),
+        'hang_restarts': sum(bot.hang_count for bot in bots)
+    })
+
+@admin_bp.route('/admin/usage', methods=['GET'])
+@admin_required
+def usage_report():
+    """Metered usage per user, heaviest CPU consumers first."""
+    hours = min(max(request.args.get('hours', 24, type=int), 1), 24 * 90)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 1000)
+    per_user = usage.totals(time.time() - hours * 3600, 'user_id')
+    top = sorted(per_user.items(), key=lambda item: item[1]['cpu_seconds'], reverse=True)[:limit]
+    users = {}
+    if top:
+        conn = get_db()
+        c = conn.cursor()
+        ids = [user_id for user_id, _ in top]
+        rows = c.execute(f'SELECT id, username, plan FROM users WHERE id IN ({",".join("?" * len(ids))})',
+                         ids).fetchall()
+        conn.close()
+        users = {row['id']: row for row in rows}
+    result = []
+    for user_id, total in top:
+        user = users.get(user_id)
+        result.append(dict(total, user_id=user_id,
+                           username=user['username'] if user else None,
+                           plan=user['plan'] if user else None))
+    return jsonify({
+        'hours': hours,
+        'users': result,
+        'total_cpu_seconds': round(sum(t['cpu_seconds'] for t in per_user.values()), 2),
+        'total_ram_mb_hours': round(sum(t['ram_mb_hours'] for t in per_user.values()), 3)
+    })
+
+# ------------------ Bulk Operations ------------------
+def _id_list(data, key):
+    ids = data.get(key)
+    if not isinstance(ids, list) or not ids:
+        return None
+    try:
+        return [int(i) for i in ids]
+    except (TypeError, ValueError):
+        return None
+
+@admin_bp.route('/admin/bulk/stop-bots', methods=['POST'])
+@admin_required
+def bulk_stop_bots():
+    bot_ids = _id_list(request.json, 'bot_ids')
+    if bot_ids is None:
+        return jsonify({'error': 'bot_ids must be a non-empty list'}), 400
+    conn = get_db()
+    c = conn.cursor()
+    placeholders = ','.join('?' * len(bot_ids))
+    rows = c.execute(f'SELECT id, user_id, status FROM bots WHERE id IN ({placeholders})', bot_ids).fetchall()
+    conn.close()
+    bots = []
+    for row in rows:
+        bot = _stoppable_manager(row['user_id'], row['id'], row['status'])
+        if bot:
+            bots.append(bot)
+    found = {row['id'] for row in rows}
+    job = stop_bots_async(bots, kind='bulk_stop_bots')
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'missing': [bot_id for bot_id in bot_ids if bot_id not in found]
+    })
+
+@admin_bp.route('/admin/bulk/suspend', methods=['POST'])
+@admin_required
+def bulk_suspend():
+    data = request.json
+    user_ids = _id_list(data, 'user_ids')
+    if user_ids is None:
+        return jsonify({'error': 'user_ids must be a non-empty list'}), 400
+    suspend = data.get('suspend', True)
+    conn = get_db()
+    c = conn.cursor()
+    c.executemany('UPDATE users SET suspended = ? WHERE id = ?',
+                  [(1 if suspend else 0, user_id) for user_id in user_ids])
+    conn.commit()
+    conn.close()
+    job_id = None
+    if suspend:
+        bots = [bot for user_id in user_ids for bot in get_user_bots(user_id)]
+        job_id = stop_bots_async(bots, kind='bulk_suspend').id
+    return jsonify({'success': True, 'job_id': job_id})
+
+@admin_bp.route('/admin/bulk/change-plan', methods=['POST'])
+@admin_required
+def bulk_change_plan():
+    data = request.json
+    user_ids = _id_list(data, 'user_ids')
+    plan = data.get('plan')
+    if user_ids is None:
+        return jsonify({'error': 'user_ids must be a non-empty list'}), 400
+    if plan not in PLANS:
+        return jsonify({'error': 'Invalid plan'}), 400
+    conn = get_db()
+    c = conn.cursor()
+    c.executemany('UPDATE users SET plan = ? WHERE id = ?', [(plan, user_id) for user_id in user_ids])
+    conn.commit()
+    conn.close()
+    for user_id in user_ids:
+        invalidate_plan(user_id)
+    return jsonify({'success': True, 'updated': len(user_ids)})
+
+@admin_bp.route('/admin/bulk/delete-users', methods=['POST'])
+@admin_required
+def bulk_delete_users():
+    user_ids = _id_list(request.json, 'user_ids')
+    if user_ids is None:
+        return jsonify({'error': 'user_ids must be a non-empty list'}), 400
+    bots = [bot for user_id in user_ids for bot in remove_user_bots(user_id)]
+    job = stop_bots_async(bots, kind='bulk_delete_users')
+    conn = get_db()
+    c = conn.cursor()
+    params = [(user_id,) for user_id in user_ids]
+    c.executemany('DELETE FROM bots WHERE user_id = ?', params)
+    c.executemany('DELETE FROM users WHERE id = ?', params)
+    conn.commit()
+    conn.close()
+    for user_id in user_ids:
+        invalidate_plan(user_id)
+    return jsonify({'success': True, 'job_id': job.id})
+
+@admin_bp.route('/admin/jobs/<job_id>', methods=['GET'])
+@admin_required
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+# ------------------ Profiling ------------------
+@admin_bp.route('/admin/profile/start', methods=['POST'])
+@admin_required
+def start_profile():
+    data = request.json or {}
+    try:
+        seconds = float(data.get('seconds', 10))
+        interval_ms = float(data.get('interval_ms', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    profiler = profiling.start_profile(seconds, interval_ms)
+    if profiler is None:
+        return jsonify({'error': 'A profile is already running'}), 409
+    return jsonify({'success': True, 'profile': profiler.status()})
+
+@admin_bp.route('/admin/profile/status', methods=['GET'])
+@admin_required
+def profile_status():
+    profiler = profiling.current_profile()
+    if not profiler:
+        return jsonify({'error': 'No profile recorded'}), 404
+    return jsonify(profiler.status())
+
+@admin_bp.route('/admin/profile/result', methods=['GET'])
+@admin_required
+def profile_result():
+    profiler = profiling.current_profile()
+    if not profiler:
+        return jsonify({'error': 'No profile recorded'}), 404
+    if profiler.running:
+        return jsonify({'error': 'Profile still running', 'profile': profiler.status()}), 409
+    return Response(
+        profiler.collapsed(),
+        mimetype='text/plain',
+        headers={'Content-Disposition': 'attachment; filename=profile.collapsed'}
+    )
+
+@admin_bp.route('/admin/slow-log', methods=['GET'])
+@admin_required
+def slow_log():
+    return jsonify({
+        'thresholds': profiling.thresholds,
+        'requests': list(profiling.slow_requests),
+        'queries': list(profiling.slow_queries)
+    })
+
+@admin_bp.route('/admin/slow-log/config', methods=['POST'])
+@admin_required
+def slow_log_config():
+    data = request.json or {}
+    for key in ('request_ms', 'query_ms'):
+        if key in data:
+            try:
+                profiling.thresholds[key] = max(0.0, float(data[key]))
+            except (TypeError, ValueError):
+                return jsonify({'error': f'{key} must be a number'}), 400
+    if data.get('clear'):
+        profiling.slow_requests.clear()
+        profiling.slow_queries.clear()
+    return jsonify({'success': True, 'thresholds': profiling.thresholds})
\ No newline at end of file
@@ -0,0 +1,114 @@
+import ast
+import json
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import storage
+
+ANALYSIS_WORKERS = 2
+ANALYSIS_TIMEOUT = 5  # seconds before an upload is accepted unanalysed
+LARGE_RANGE = 10 ** 6
+DANGEROUS_CALLS = {
+    'eval', 'exec', '__import__', 'os.system', 'os.fork', 'os.popen',
+    'subprocess.Popen', 'subprocess.run', 'subprocess.call', 'subprocess.check_output'
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+_cache = {}  # sha256 -> analysis result
+
+def _call_name(node):
+    func = node.func
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+        return f'{func.value.id}.{func.attr}'
+    return None
+
+def _is_true(node):
+    return isinstance(node, ast.Constant) and bool(node.value) and not isinstance(node.value, str)
+
+def find_suspicious(tree):
+    """Return warnings for constructs that tend to hang or escape a bot."""
+    warnings = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.While) and _is_true(node.test):
+            inner = [n for stmt in node.body for n in ast.walk(stmt)]
+            exits = any(isinstance(n, (ast.Break, ast.Return, ast.Raise)) for n in inner)
+            calls = any(isinstance(n, (ast.Call, ast.Await)) for n in inner)
+            if not exits and not calls:
+                warnings.append({'line': node.lineno, 'message': 'Busy loop: "while True" with no break, sleep or call'})
+        elif isinstance(node, ast.For) and isinstance(node.iter, ast.Call) and _call_name(node.iter) == 'range':
+            bounds = [a.value for a in node.iter.args if isinstance(a, ast.Constant) and isinstance(a.value, int)]
+            if bounds and max(bounds) >= LARGE_RANGE:
+                warnings.append({'line': node.lineno, 'message': f'Very large loop: range({max(bounds)})'})
+        elif isinstance(node, ast.Call) and _call_name(node) in DANGEROUS_CALLS:
+            warnings.append({'line': node.lineno, 'message': f'Suspicious call: {_call_name(node)}()'})
+    return sorted(warnings, key=lambda w: w['line'])
+
+def _analyze_file(source_path):
+    """Runs in a worker process: parse and lint one file."""
+    with open(source_path, 'rb') as f:
+        source = f.read()
+    try:
+        tree = ast.parse(source, filename='bot.py')
+        # compile() also catches errors ast.parse lets through,
+        # e.g. 'return' outside a function
+        compile(tree, 'bot.py', 'exec')
+    except SyntaxError as e:
+        return {
+            'ok': False,
+            'errors': [{'line': e.lineno, 'col': e.offset, 'message': e.msg}],
+            'warnings': []
+        }
+    except ValueError as e:  # e.g. null bytes in the source
+        return {'ok': False, 'errors': [{'line': None, 'col': None, 'message': str(e)}], 'warnings': []}
+    return {'ok': True, 'errors': [], 'warnings': find_suspicious(tree)}
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            _pool = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, mp_context=ctx)
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+def _result_path(sha):
+    return storage.object_path(sha) + '.analysis.json'
+
+def analyze(sha):
+    """Analyse a stored object, cached by content hash."""
+    result = _cache.get(sha)
+    if result is not None:
+        return result
+    try:
+        with open(_result_path(sha)) as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        try:
+            future = _get_pool().submit(_analyze_file, storage.object_path(sha))
+            result = future.result(timeout=ANALYSIS_TIMEOUT)
+        except BrokenProcessPool:
+            # A worker died; replace the pool and analyse this one inline
+            _reset_pool()
+            result = _analyze_file(storage.object_path(sha))
+        except FutureTimeout:
+            # Don't cache: a later upload of the same file gets another try
+            return {'ok': True, 'errors': [], 'warnings': [{'line': None, 'message': 'Analysis timed out'}]}
+        tmp_path = f'{_result_path(sha)}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, _result_path(sha))
+    _cache[sha] = result
+    return result
@@ -1,31 +1,102 @@
 import os
-from flask import Flask, render_template, request, jsonify, session, send_file, abort
+from flask import Flask, render_template, request, jsonify, session, send_file, abort, g, Response
 from werkzeug.utils import secure_filename
 from functools import wraps
 import threading
 import time
+import uuid
+from datetime import datetime
 import sqlite3
 
 from auth import login_required, admin_required, signup_user, login_user, logout_user
+import models
 from models import get_db
 from utils import (
     get_user_upload_dir, validate_file_extension, validate_file_size,
-    get_current_user, format_timestamp
+    get_current_user, format_timestamp, fingerprint, MAX_FILE_SIZE
 )
 from bot_manager import (
-    get_bot_manager, create_bot_manager, delete_bot_manager, user_bots
+    get_bot_manager, create_bot_manager, delete_bot_manager,
+    load_user_bots, remove_user_bots, stop_bots_async, get_command, draining, LOG_BUFFER_SIZE
+)
+from plan_manager import (
+    get_user_limits, upgrade_user_plan, get_user_plan, get_plan_limits, plan_version,
+    invalidate_plan, PLANS
 )
-from plan_manager import get_user_limits, upgrade_user_plan, PLANS
 from admin import admin_bp
 import security
+import jobs
+import storage
+import metrics
+import profiling
+import assets
+import compression
+import cluster
+import usage
+import lifecycle
+import health
 
 app = Flask(__name__, 
             static_folder='../frontend',
             template_folder='../frontend')
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.permanent_session_lifetime = 86400  # 1 day
+app.config['MAX_CONTENT_LENGTH'] = 3 * MAX_FILE_SIZE  # both files plus form overhead
 
+models.bootstrap()
 app.register_blueprint(admin_bp)
+app.register_blueprint(cluster.cluster_bp)
+if cluster.is_coordinator():
+    cluster.init_coordinator()
+
+# ------------------ Static Assets & Compression ------------------
+assets.build()
+app.add_template_global(assets.asset_url)
+app.after_request(compression.compress_response)
+
+@app.route('/assets/<filename>')
+@app.route('/style.css', defaults={'filename': 'style.css'})
+@app.route('/script.js', defaults={'filename': 'script.js'})
+def static_asset(filename):
+    asset = assets.get_asset(filename)
+    if not asset:
+        abort(404)
+    body = asset['data']
+    gzipped = asset['gzip'] is not None and compression.accepts_gzip()
+    if gzipped:
+        body = asset['gzip']
+    response = Response(body, mimetype=asset['mimetype'])
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    if asset['gzip'] is not None:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(asset['etag'], weak=gzipped)
+    response.headers['Cache-Control'] = assets.IMMUTABLE if asset['immutable'] else 'no-cache'
+    return response.make_conditional(request)
+
+# ------------------ Instrumentation ------------------
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Label by URL rule, not path, to keep cardinality bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        duration = time.perf_counter() - start
+        metrics.http_latency.observe(duration, route=route, method=request.method)
+        metrics.http_requests.inc(route=route, method=request.method, status=response.status_code)
+        profiling.record_request(route, request.method, request.path, response.status_code, duration)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render_latest(), mimetype=None, content_type=metrics.CONTENT_TYPE)
 
 # ------------------ Helper Functions ------------------
 def login_required_api(f):
@@ -36,6 +107,25 @@ def login_required_api(f):
         return f(*args, **kwargs)
     return decorated
 
+# ------------------ Conditional GET ------------------
+# ETags embed a per-process id so validators never survive a restart
+BOOT_ID = uuid.uuid4().hex[:8]
+
+def conditional_json(version, build):
+    """JSON response for build(), or 304 if the client has this version.
+
+    version must be cheap to compute; build() only runs on a miss.
+    """
+    etag = f'{BOOT_ID}-{session["user_id"]}-{fingerprint(version)}'
+    # Weak comparison: compression turns the ETag weak on the way out
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 # ------------------ Auth Routes ------------------
 @app.route('/')
 def index():
@@ -102,11 +192,11 @@ def create_bot():
 @login_required_api
 def list_bots():
     user_id = session['user_id']
-    conn = get_db()
-    c = conn.cursor()
-    bots = c.execute('SELECT id, bot_name, status FROM bots WHERE user_id = ? ORDER BY created_at DESC', (user_id,)).fetchall()
-    conn.close()
-    return jsonify([dict(b) for b in bots])
+    bots = sorted(load_user_bots(user_id), key=lambda b: b.bot_id, reverse=True)
+    return conditional_json(
+        tuple((b.bot_id, b.state_version) for b in bots),
+        lambda: [{'id': b.bot_id, 'bot_name': b.bot_name, 'status': b.status} for b in bots]
+    )
 
 @app.route('/upload', methods=['POST'])
 @login_required_api
@@ -125,27 +215,50 @@ def upload_files():
     if not bot:
         return jsonify({'error': 'Invalid bot'}), 403
     
-    files = request.files
-    upload_dir = get_user_upload_dir(username)
-    
-    for key in files:
-        file = files[key]
-        if file.filename == '':
-            continue
+    files = [f for f in request.files.values() if f.filename != '']
+    for file in files:
         if not validate_file_extension(file.filename):
             return jsonify({'error': f'Invalid file type: {file.filename}. Only requirements.txt and bot.py allowed'}), 400
-        if not validate_file_size(file):
+
+    # Stream each file into the object store first, then swap them into
+    # the bot's working directory so a running bot never sees a partial file
+    stored = []
+    for file in files:
+        result = storage.store_stream(file.stream)
+        if result is None:
             return jsonify({'error': f'File too large: {file.filename}. Max 1MB'}), 400
-        
-        filename = secure_filename(file.filename)
-        file.save(os.path.join(upload_dir, filename))
-    
-    return jsonify({'success': True})
+        stored.append((secure_filename(file.filename), result[0]))
+
+    # Reject code that can't even compile before it reaches the bot
+    import analysis  # pulls in multiprocessing; only uploads need it
+    warnings = {}
+    for filename, sha in stored:
+        if filename != 'bot.py':
+            continue
+        result = analysis.analyze(sha)
+        if not result['ok']:
+            return jsonify({'error': f'{filename} has errors', 'errors': result['errors']}), 400
+        warnings[filename] = result['warnings']
+
+    upload_dir = get_user_upload_dir(username)
+    report = {}
+    for filename, sha in stored:
+        changed = storage.install_object(sha, upload_dir, filename)
+        report[filename] = {'sha256': sha, 'changed': changed, 'warnings': warnings.get(filename, [])}
+
+    return jsonify({'success': True, 'files': report})
+
+@app.errorhandler(413)
+def request_too_large(e):
+    # Bodies over MAX_CONTENT_LENGTH are rejected before the upload route runs
+    return jsonify({'error': 'Upload too large. Max 1MB per file'}), 413
 
 @app.route('/bot/start', methods=['POST'])
 @login_required_api
 @security.rate_limit(lambda: session.get('user_id', 'anon'))
 def start_bot_route():
+    if draining.is_set():
+        return jsonify({'success': False, 'message': 'Server is shutting down'}), 503
     data = request.json
     bot_id = data.get('bot_id')
     user_id = session['user_id']
@@ -167,6 +280,11 @@ def start_bot_route():
     if not manager:
         # Should exist, but if not, create
         manager = create_bot_manager(user_id, bot_id, session['username'], '')
+    if cluster.is_coordinator():
+        # Pick the node with the most headroom for this plan
+        manager, error = cluster.place(manager)
+        if manager is None:
+            return jsonify({'success': False, 'message': error}), 503
     
     success, msg = manager.start()
     return jsonify({'success': success, 'message': msg})
@@ -187,20 +305,25 @@ def stop_bot():
 @app.route('/bot/restart', methods=['POST'])
 @login_required_api
 def restart_bot():
+    if draining.is_set():
+        return jsonify({'success': False, 'message': 'Server is shutting down'}), 503
     data = request.json
     bot_id = data.get('bot_id')
     user_id = session['user_id']
     manager = get_bot_manager(user_id, bot_id)
     if manager:
-        if manager.status == 'RUNNING':
-            manager.stop()
-            # Wait a bit
-            import time
-            time.sleep(2)
-        success, msg = manager.start()
-        return jsonify({'success': success, 'message': msg})
+        job = manager.restart(owner_id=user_id)
+        return jsonify({'success': True, 'message': 'Restart scheduled', 'op_id': job.id})
     return jsonify({'error': 'Bot not found'}), 404
 
+@app.route('/bot/operation', methods=['GET'])
+@login_required_api
+def bot_operation():
+    job = jobs.get_job(request.args.get('op_id', ''))
+    if not job or job.owner_id != session['user_id']:
+        return jsonify({'error': 'Operation not found'}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/bot/logs', methods=['GET'])
 @login_required_api
 def get_logs():
@@ -210,9 +333,29 @@ def get_logs():
     if manager:
         limits = get_user_limits(user_id)
         max_lines = limits['max_log_lines']
-        logs = manager.get_logs(max_lines)
-        return jsonify({'logs': logs})
-    return jsonify({'logs': []})
+        # since=<seq> returns only newer lines; pass back the returned seq
+        logs, seq = manager.get_logs_since(request.args.get('since', type=int), max_lines)
+        return jsonify({'logs': logs, 'seq': seq})
+    return jsonify({'logs': [], 'seq': 0})
+
+@app.route('/bot/health', methods=['GET', 'POST'])
+@login_required_api
+def bot_health():
+    """Read or change a bot's liveness checks (0 or null turns one off)."""
+    data = request.json if request.method == 'POST' else request.args
+    bot_id = data.get('bot_id')
+    user_id = session['user_id']
+    manager = get_bot_manager(user_id, bot_id)
+    if not manager:
+        return jsonify({'error': 'Bot not found'}), 404
+    if request.method == 'GET':
+        return jsonify({'success': True, 'health': health.get_config(manager.bot_id)})
+    config, error = health.validate(data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    # Bots on cluster nodes pick the new settings up on their next start
+    manager.set_health(health.save(manager.bot_id, config))
+    return jsonify({'success': True, 'health': config})
 
 @app.route('/bot/status', methods=['GET'])
 @login_required_api
@@ -221,20 +364,13 @@ def bot_status():
     user_id = session['user_id']
     manager = get_bot_manager(user_id, bot_id)
     if manager:
-        # Also get from DB in case manager not started but DB says running?
-        conn = get_db()
-        c = conn.cursor()
-        db_status = c.execute('SELECT status FROM bots WHERE id = ?', (bot_id,)).fetchone()
-        conn.close()
-        status = manager.status
-        if db_status:
-            status = db_status['status']  # Use DB as source of truth
-        else:
-            status = 'STOPPED'
-        return jsonify({
-            'status': status,
+        # The supervisor writes every status change through to the DB,
+        # so the in-memory record is authoritative here
+        return conditional_json(manager.state_version, lambda: {
+            'status': manager.status,
             'start_time': manager.start_time.isoformat() if manager.start_time else None,
             'restart_count': manager.restart_count,
+            'hang_count': manager.hang_count,
             'error_reason': manager.error_reason
         })
     else:
@@ -251,23 +387,100 @@ def bot_resources():
     bot_id = request.args.get('bot_id')
     user_id = session['user_id']
     manager = get_bot_manager(user_id, bot_id)
-    if manager and manager.status == 'RUNNING':
-        return jsonify(manager.get_resources())
-    return jsonify({'cpu': 0, 'ram': 0})
+    if not manager:
+        return jsonify({'cpu': 0, 'ram': 0})
+    return conditional_json(manager.resource_version, lambda: (
+        manager.get_resources() if manager.status == 'RUNNING' else {'cpu': 0, 'ram': 0}
+    ))
+
+# ------------------ Dashboard State ------------------
+@app.route('/dashboard/state', methods=['GET'])
+@login_required_api
+def dashboard_state():
+    """Plan, every bot's status and resources, and optional log tails.
+
+    Query: logs=<bot_id,...> selects bots to include a log tail for;
+    log_lines caps the tail (never above the plan's max_log_lines) and
+    log_since=<seq> limits it to lines newer than a previous log_seq.
+    Built from in-memory state only, so a poll costs no SQLite queries.
+    """
+    user_id = session['user_id']
+    plan = get_user_plan(user_id)
+    limits = get_plan_limits(plan)
+    bots = sorted(load_user_bots(user_id), key=lambda b: b.bot_id, reverse=True)
+    log_ids = set()
+    for bot_id in request.args.get('logs', '').split(','):
+        if bot_id.strip().isdigit():
+            log_ids.add(int(bot_id))
+    max_lines = limits['max_log_lines']
+    requested = request.args.get('log_lines', type=int)
+    if requested and requested > 0:
+        max_lines = min(requested, max_lines)
+    since = request.args.get('log_since', type=int)
+
+    # uptime_seconds is derived from start_time, which is versioned
+    version = (plan_version(user_id), plan, max_lines, since, tuple(
+        (b.bot_id, b.state_version, b.resource_version, b.log_seq if b.bot_id in log_ids else None)
+        for b in bots
+    ))
+
+    def build():
+        now = datetime.now()
+        logs, log_seq = {}, {}
+        for b in bots:
+            if b.bot_id in log_ids:
+                logs[b.bot_id], log_seq[b.bot_id] = b.get_logs_since(since, max_lines)
+        return {
+            'plan': plan,
+            'limits': limits,
+            'bots': [b.get_state(now) for b in bots],
+            'logs': logs,
+            'log_seq': log_seq
+        }
+    return conditional_json(version, build)
+
+MAX_BATCH_COMMANDS = 50
 
 @app.route('/bot/command', methods=['POST'])
 @login_required_api
 def send_command():
+    """Queue one command ({command}) or a batch ({commands: [...]}).
+
+    Returns at once with each command's delivery status; the supervisor
+    writes them to the bot's stdin in order. Poll /bot/command/status
+    for commands still 'queued'.
+    """
     data = request.json
     bot_id = data.get('bot_id')
-    cmd = data.get('command')
+    cmds = data.get('commands')
+    if cmds is None:
+        cmds = [data.get('command')]
+    elif not isinstance(cmds, list) or not cmds or len(cmds) > MAX_BATCH_COMMANDS:
+        return jsonify({'success': False, 'error': f'commands must be a list of 1-{MAX_BATCH_COMMANDS} strings'}), 400
     user_id = session['user_id']
     manager = get_bot_manager(user_id, bot_id)
     if manager and manager.status == 'RUNNING':
-        success = manager.send_command(cmd)
-        return jsonify({'success': success})
+        commands = manager.send_commands([str(cmd) if cmd is not None else '' for cmd in cmds])
+        return jsonify({
+            'success': all(c.status != 'dropped' for c in commands),
+            'commands': [c.to_dict() for c in commands]
+        })
     return jsonify({'success': False, 'error': 'Bot not running'}), 400
 
+@app.route('/bot/command/status', methods=['GET'])
+@login_required_api
+def command_status():
+    """Delivery status for ids=<command_id,...>; unknown ids are omitted."""
+    user_id = session['user_id']
+    commands = []
+    for command_id in request.args.get('ids', '').split(',')[:MAX_BATCH_COMMANDS]:
+        command = get_command(command_id.strip())
+        if command and command.user_id == user_id:
+            commands.append(command)
+    # Commands queued on nodes: one status RPC per node, not per id
+    cluster.refresh_commands(commands)
+    return jsonify({'commands': [c.to_dict() for c in commands]})
+
 @app.route('/bot/logs/download', methods=['GET'])
 @login_required_api
 def download_logs():
@@ -276,18 +489,17 @@ def download_logs():
     manager = get_bot_manager(user_id, bot_id)
     if not manager:
         return jsonify({'error': 'Bot not found'}), 404
-    logs = manager.get_logs(manager.log_queue.maxlen)
-    content = '\n'.join([f'[{ts}] {"[ERROR]" if err else ""} {line}' for ts, line, err in logs])
-    from io import BytesIO
-    buffer = BytesIO()
-    buffer.write(content.encode('utf-8'))
-    buffer.seek(0)
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=f'bot_{bot_id}_logs.txt',
-        mimetype='text/plain'
-    )
+    logs = manager.get_logs(LOG_BUFFER_SIZE)
+
+    def generate():
+        # Streamed (and gzipped on the fly) instead of built in memory
+        for i, (ts, line, err) in enumerate(logs):
+            separator = '\n' if i else ''
+            yield f'{separator}[{ts}] {"[ERROR]" if err else ""} {line}'
+
+    response = Response(generate(), mimetype='text/plain')
+    response.headers.set('Content-Disposition', 'attachment', filename=f'bot_{manager.bot_id}_logs.txt')
+    return response
 
 # ------------------ Account Management ------------------
 @app.route('/account/change-password', methods=['POST'])
@@ -315,12 +527,8 @@ def change_password():
 def delete_account():
     user_id = session['user_id']
     username = session['username']
-    # Stop all bots
-    if user_id in user_bots:
-        for bot in user_bots[user_id].values():
-            if bot.status == 'RUNNING':
-                bot.stop()
-        del user_bots[user_id]
+    # Stop all bots in the background
+    stop_bots_async(remove_user_bots(user_id), kind='delete_account', owner_id=user_id)
     # Delete from DB
     conn = get_db()
     c = conn.cursor()
@@ -328,6 +536,7 @@ def delete_account():
     c.execute('DELETE FROM users WHERE id = ?', (user_id,))
     conn.commit()
     conn.close()
+    invalidate_plan(user_id)
     # Delete upload directory
     import shutil
     upload_dir = get_user_upload_dir(username)
@@ -343,12 +552,10 @@ def delete_account():
 @login_required_api
 def plan_info():
     user_id = session['user_id']
-    from plan_manager import get_user_plan, get_plan_limits
     plan = get_user_plan(user_id)
-    limits = get_plan_limits(plan)
-    return jsonify({
+    return conditional_json((plan_version(user_id), plan), lambda: {
         'plan': plan,
-        'limits': limits
+        'limits': get_plan_limits(plan)
     })
 
 @app.route('/upgrade-plan', methods=['POST'])
@@ -360,6 +567,33 @@ def upgrade_plan():
     success, msg = upgrade_user_plan(user_id, new_plan)
     return jsonify({'success': success, 'message': msg})
 
+# ------------------ Usage ------------------
+USAGE_MAX_HOURS = 24 * 90
+
+def _usage_since():
+    hours = min(max(request.args.get('hours', 24, type=int), 1), USAGE_MAX_HOURS)
+    return hours, time.time() - hours * 3600
+
+@app.route('/usage', methods=['GET'])
+@login_required_api
+def usage_report():
+    """Metered CPU-seconds and RAM MB-hours per bot, plus an hourly series."""
+    user_id = session['user_id']
+    hours, since = _usage_since()
+    per_bot = usage.totals(since, 'bot_id', user_id)
+    conn = get_db()
+    c = conn.cursor()
+    names = {row['id']: row['bot_name'] for row in
+             c.execute('SELECT id, bot_name FROM bots WHERE user_id = ?', (user_id,)).fetchall()}
+    conn.close()
+    hourly = usage.totals(since, 'hour', user_id)
+    return jsonify({
+        'hours': hours,
+        'bots': [dict(total, bot_id=bot_id, bot_name=names.get(bot_id)) for bot_id, total in sorted(per_bot.items())],
+        'hourly': [dict(total, hour=datetime.utcfromtimestamp(hour).isoformat() + 'Z')
+                   for hour, total in sorted(hourly.items())]
+    })
+
 # ------------------ Security ------------------
 @app.route('/security/warnings', methods=['GET'])
 @login_required_api
@@ -391,4 +625,6 @@ def upgrade_page():
 # ------------------ Run ------------------
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
+    lifecycle.reconcile()
+    lifecycle.install_signal_handlers()
     app.run(host='0.0.0.0', port=port, debug=False)
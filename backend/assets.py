@@ -0,0 +1,52 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+# Static assets are read, hashed and gzipped once at startup. Pages link to
+# /assets/<name>.<hash>.<ext>, which can be cached forever: a new build
+# gets a new URL.
+FRONTEND_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend'))
+ASSET_EXTENSIONS = ('.css', '.js', '.svg', '.png', '.ico')
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_assets = {}  # served name -> asset
+_urls = {}    # source name -> hashed URL
+
+def build(directory=FRONTEND_DIR):
+    assets, urls = {}, {}
+    for name in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(name)
+        if ext not in ASSET_EXTENSIONS:
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        compressed = None
+        if ext in COMPRESSIBLE_EXTENSIONS:
+            compressed = gzip.compress(data, 9, mtime=0)
+            if len(compressed) >= len(data):
+                compressed = None
+        asset = {
+            'data': data,
+            'gzip': compressed,
+            'mimetype': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+            'etag': digest
+        }
+        hashed = f'{stem}.{digest}{ext}'
+        assets[hashed] = dict(asset, immutable=True)
+        # The plain name stays reachable for pages that aren't templated
+        assets[name] = dict(asset, immutable=False)
+        urls[name] = f'/assets/{hashed}'
+    _assets.clear()
+    _assets.update(assets)
+    _urls.clear()
+    _urls.update(urls)
+
+def asset_url(name):
+    """Cache-busting URL for a frontend file; use from templates."""
+    return _urls.get(name, f'/assets/{name}')
+
+def get_asset(name):
+    return _assets.get(name)
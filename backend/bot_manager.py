@@ -3,48 +3,164 @@ import threading
 import time
 import os
 import signal
-import queue
-import psutil
+import uuid
 from datetime import datetime, timedelta
-from collections import deque
+from collections import deque, OrderedDict
+from itertools import islice
 from flask import session
-from utils import get_user_upload_dir, escape_log_output
+from utils import get_user_upload_dir, escape_log_output, fingerprint
 from plan_manager import get_user_limits, can_start_bot
 import security
+import jobs
+import storage
+import metrics
+import usage
+import health
 
 # Global storage: user_bots[user_id][bot_id] = BotProcess
+# Readers never lock: the per-user dicts are copy-on-write and only
+# replaced (never mutated) under registry_lock. Entries are hydrated
+# lazily from the bots table on first lookup.
 user_bots = {}
-bot_lock = threading.RLock()
+registry_lock = threading.Lock()
+
+# Hashes of requirements.txt files already pip-installed into this environment
+_installed_requirements = set()
+
+LOG_BUFFER_SIZE = 5000
+STOP_TIMEOUT = 5  # seconds between SIGTERM and SIGKILL
+SUPERVISOR_INTERVAL = 0.5
+SAMPLE_INTERVAL = 2  # seconds between resource samples of a running bot
+LIMITS_REFRESH = 30  # seconds before a running bot re-reads its plan limits
+COMMAND_QUEUE_SIZE = 100  # queued stdin commands per bot before new ones are dropped
+MAX_COMMANDS = 1000  # recent commands kept for status lookups
+
+# Set by lifecycle.drain() while the process shuts down; no new bots start
+draining = threading.Event()
+
+# Bots share a fixed pool of locks instead of owning one each
+_lock_stripes = [threading.Lock() for _ in range(64)]
+
+class RunState:
+    """Structures a bot only needs while it runs; dropped when it exits."""
+    __slots__ = (
+        'stop_event', 'exited', 'process', 'ps', 'log_timestamps', 'kill_deadline',
+        'runtime_deadline', 'restart_job', 'limits', 'limits_at', 'next_sample', 'commands',
+        'cpu_time', 'sampled_at', 'last_output', 'last_cpu', 'last_heartbeat', 'hung',
+        'update_db'
+    )
+
+    def __init__(self, limits):
+        self.stop_event = threading.Event()
+        self.exited = threading.Event()
+        self.process = None
+        self.ps = None  # psutil handle kept so cpu_percent() can diff samples
+        self.log_timestamps = deque(maxlen=200)  # for spam detection
+        self.kill_deadline = None
+        self.runtime_deadline = None
+        self.restart_job = None
+        self.limits = limits
+        self.limits_at = time.monotonic()
+        self.next_sample = 0
+        self.commands = deque()  # Commands waiting for the supervisor to write them
+        self.cpu_time = 0.0  # process CPU seconds at the previous sample, for metering
+        self.sampled_at = 0
+        # Liveness timestamps (monotonic), reset for every process
+        self.last_output = self.last_cpu = self.last_heartbeat = time.monotonic()
+        self.hung = None  # why the liveness check killed the current process
+        # False when the caller of stop() writes the final status itself, in bulk
+        self.update_db = True
+
+class Command:
+    """One line of stdin for a bot: queued, then written or dropped."""
+    __slots__ = ('id', 'user_id', 'bot_id', 'text', 'pending', 'status', 'detail', 'created_at', 'written_at')
+
+    def __init__(self, bot, text):
+        self.id = uuid.uuid4().hex[:16]
+        self.user_id = bot.user_id
+        self.bot_id = bot.bot_id
+        self.text = text
+        self.pending = (text + '\n').encode('utf-8')  # bytes not yet written
+        self.status = 'queued'
+        self.detail = None
+        self.created_at = time.time()
+        self.written_at = None
+
+    def drop(self, detail):
+        self.status = 'dropped'
+        self.detail = detail
+
+    def to_dict(self):
+        return {
+            'command_id': self.id,
+            'bot_id': self.bot_id,
+            'command': self.text,
+            'status': self.status,
+            'detail': self.detail,
+            'created_at': self.created_at,
+            'written_at': self.written_at
+        }
 
 class BotProcess:
+    # Idle bots are just these fields; see RunState for the rest
+    __slots__ = (
+        'user_id', 'bot_id', 'username', 'bot_name', 'status', 'start_time',
+        'restart_count', 'max_restarts', 'crash_detected', 'error_reason',
+        'cpu_usage', 'ram_usage', 'log_queue', 'log_seq', 'health', 'hang_count', '_run', '_starting'
+    )
+
     def __init__(self, user_id, bot_id, username, bot_name):
         self.user_id = user_id
         self.bot_id = bot_id
         self.username = username
         self.bot_name = bot_name
-        self.process = None
         self.status = 'STOPPED'  # RUNNING, STOPPED, ERROR
-        self.log_queue = deque(maxlen=5000)  # store (timestamp, line, is_error)
         self.start_time = None
-        self.stop_event = threading.Event()
         self.restart_count = 0
-        self.max_restarts = get_user_limits(user_id)['max_restarts']
+        self.max_restarts = None  # read from the plan on start
         self.crash_detected = False
         self.error_reason = None
         self.cpu_usage = 0.0
         self.ram_usage = 0
-        self.command_queue = queue.Queue()
-        self.log_timestamps = deque(maxlen=200)  # for spam detection
-        self.auto_stop_timer = None
+        self.log_queue = None  # deque of (timestamp, line, is_error), created on first log
+        self.log_seq = 0  # lines ever logged; a cheap version for the log tail
+        self.health = None  # HealthCheck, read from the DB on start
+        self.hang_count = 0  # processes killed as hung since the last start
+        self._run = None
+        self._starting = False
+
+    @property
+    def _lock(self):
+        return _lock_stripes[hash(self.bot_id) % len(_lock_stripes)]
+
+    @property
+    def active(self):
+        """Running, or between processes (installing requirements, waiting to restart)."""
+        return self.status == 'RUNNING' or self._run is not None
+
+    @property
+    def process(self):
+        run = self._run
+        return run.process if run else None
 
     def _get_work_dir(self):
         return get_user_upload_dir(self.username)
 
     def install_requirements(self):
-        req_path = os.path.join(self._get_work_dir(), 'requirements.txt')
+        work_dir = self._get_work_dir()
+        req_path = os.path.join(work_dir, 'requirements.txt')
         if os.path.exists(req_path):
+            digest = storage.file_digest(work_dir, 'requirements.txt')
+            installed = storage.read_manifest(work_dir).get('requirements_installed')
+            if digest in _installed_requirements or digest == installed:
+                self._add_log('requirements.txt unchanged, skipping install', False)
+                return True
             try:
+                started = time.perf_counter()
                 subprocess.run(['pip', 'install', '-r', req_path], check=True, capture_output=True, text=True)
+                metrics.install_latency.observe(time.perf_counter() - started)
+                _installed_requirements.add(digest)
+                storage.update_manifest(work_dir, requirements_installed=digest)
                 self._add_log('requirements.txt installed successfully', False)
             except subprocess.CalledProcessError as e:
                 self._add_log(f'Failed to install requirements: {e.stderr}', True)
@@ -54,43 +170,73 @@ class BotProcess:
         return True
 
     def start(self):
-        with bot_lock:
-            if self.status == 'RUNNING':
+        if draining.is_set():
+            return False, 'Server is shutting down'
+        with self._lock:
+            run = self._run
+            # A RUNNING status without a run was only read from the DB
+            if self._starting or (run and not run.stop_event.is_set()):
                 return False, 'Bot already running'
-            
-            # Check limits
+            if run:
+                return False, 'Bot is still stopping'
+            self._starting = True
+
+        # Limit check and DB write happen outside the lock
+        try:
             allowed, msg = can_start_bot(self.user_id)
             if not allowed:
                 return False, msg
-            
-            self.stop_event.clear()
+
+            limits = get_user_limits(self.user_id)
+            self.max_restarts = limits['max_restarts']
             self.restart_count = 0
+            self.hang_count = 0
+            self.health = health.load(self.bot_id)
             self.crash_detected = False
             self.error_reason = None
-            
+
             # Save bot status to DB
-            from models import get_db
-            conn = get_db()
-            c = conn.cursor()
-            c.execute('UPDATE bots SET status = ? WHERE id = ?', ('RUNNING', self.bot_id))
-            conn.commit()
-            conn.close()
-            
-            # Start the bot in a thread
-            threading.Thread(target=self._run_bot, daemon=True).start()
-            # Start resource monitor
-            threading.Thread(target=self._monitor_resources, daemon=True).start()
+            self._update_db_status('RUNNING')
+
+            run = RunState(limits)
+            with self._lock:
+                self._run = run
+            _track_running(self)
+            # One thread per running bot reads its output; sampling, kill
+            # escalation and runtime limits live in the shared supervisor
+            threading.Thread(target=self._run_bot, args=(run,), name=f'bot-{self.bot_id}-run', daemon=True).start()
             return True, 'Bot started'
+        finally:
+            self._starting = False
+
+    def _run_bot(self, run):
+        try:
+            self._supervise(run)
+        finally:
+            with self._lock:
+                run.process = None
+                restart_job = run.restart_job
+                run.restart_job = None
+                self._run = None
+                run.exited.set()
+            self.cpu_usage = 0.0
+            self.ram_usage = 0
+            _drop_commands(run, 'Bot stopped')
+            if restart_job:
+                # The old process group is gone; start again right away
+                restart_job.update(self.bot_id, 'starting')
+                success, msg = self.start()
+                restart_job.complete_item(self.bot_id, success, msg)
 
-    def _run_bot(self):
+    def _supervise(self, run):
         # Install requirements
         if not self.install_requirements():
             self.status = 'ERROR'
             self.error_reason = 'Requirements installation failed'
             self._update_db_status('ERROR')
             return
-        
-        while not self.stop_event.is_set() and self.restart_count <= self.max_restarts:
+
+        while not run.stop_event.is_set() and self.restart_count <= self.max_restarts:
             bot_path = os.path.join(self._get_work_dir(), 'bot.py')
             if not os.path.exists(bot_path):
                 self._add_log('bot.py not found', True)
@@ -98,21 +244,21 @@ class BotProcess:
                 self.error_reason = 'bot.py missing'
                 self._update_db_status('ERROR')
                 return
-            
+
             self._add_log(f'Starting bot (attempt {self.restart_count+1})...', False)
             self.status = 'RUNNING'
             self._update_db_status('RUNNING')
             self.start_time = datetime.now()
-            
-            # Auto-stop after plan runtime
-            limits = get_user_limits(self.user_id)
-            runtime_seconds = limits['max_runtime_hours'] * 3600
-            self.auto_stop_timer = threading.Timer(runtime_seconds, self._auto_stop)
-            self.auto_stop_timer.daemon = True
-            self.auto_stop_timer.start()
-            
+
+            # Auto-stop after plan runtime (enforced by the supervisor)
+            run.runtime_deadline = time.monotonic() + run.limits['max_runtime_hours'] * 3600
+            run.last_output = run.last_cpu = run.last_heartbeat = time.monotonic()
+            run.hung = None
+            # A kill armed for the previous process must not hit this one
+            run.kill_deadline = None
+
             try:
-                self.process = subprocess.Popen(
+                process = subprocess.Popen(
                     ['python', bot_path],
                     cwd=self._get_work_dir(),
                     stdout=subprocess.PIPE,
@@ -122,29 +268,45 @@ class BotProcess:
                     bufsize=1,
                     preexec_fn=os.setsid if hasattr(os, 'setsid') else None
                 )
-                
+                # Commands are written by the supervisor; never block it
+                os.set_blocking(process.stdin.fileno(), False)
+                with self._lock:
+                    run.process = process
+                    stopped = run.stop_event.is_set()
+                if stopped:
+                    # stop() raced with the spawn; make sure it gets signalled
+                    self._signal_stop(run, process)
+
                 # Read output line by line
-                for line in iter(self.process.stdout.readline, ''):
-                    if self.stop_event.is_set():
-                        self.process.terminate()
+                for line in iter(process.stdout.readline, ''):
+                    if run.stop_event.is_set():
                         break
                     if line:
+                        run.last_output = time.monotonic()
+                        check = self.health
+                        if check is not None and check.pattern is not None and check.pattern in line:
+                            run.last_heartbeat = run.last_output
                         self._add_log(line.rstrip(), False)
-                
-                self.process.wait()
-                exit_code = self.process.returncode
+                        metrics.bot_log_lines.inc(bot_id=self.bot_id)
+
+                # If the bot ignores SIGTERM the supervisor escalates to SIGKILL
+                process.wait()
+                exit_code = process.returncode
                 self._add_log(f'Bot exited with code {exit_code}', False)
-                
-                if self.auto_stop_timer:
-                    self.auto_stop_timer.cancel()
-                
-                if not self.stop_event.is_set() and exit_code != 0:
-                    # Crash detected
+                run.runtime_deadline = None
+
+                if not run.stop_event.is_set() and (exit_code != 0 or run.hung):
+                    # Crash detected (a hung bot may exit cleanly on SIGTERM)
                     self.crash_detected = True
                     self.restart_count += 1
+                    if run.hung:
+                        metrics.bot_hangs.inc()
+                    else:
+                        metrics.bot_crashes.inc()
                     if self.restart_count <= self.max_restarts:
+                        metrics.bot_restarts.inc(reason='hung' if run.hung else 'crash')
                         self._add_log(f'Restarting ({self.restart_count}/{self.max_restarts})...', True)
-                        time.sleep(2)  # Wait before restart
+                        run.stop_event.wait(2)  # Wait before restart
                     else:
                         self._add_log('Max restarts exceeded. Bot stopped.', True)
                         self.status = 'ERROR'
@@ -153,81 +315,226 @@ class BotProcess:
                 else:
                     # Normal stop
                     break
-                    
+
             except Exception as e:
                 self._add_log(f'Error: {str(e)}', True)
                 self.status = 'ERROR'
                 self.error_reason = str(e)
                 self._update_db_status('ERROR')
                 break
-        
+
         if self.status != 'ERROR':
             self.status = 'STOPPED'
-            self._update_db_status('STOPPED')
+            if run.update_db:
+                self._update_db_status('STOPPED')
         self._add_log('Bot stopped', False)
 
     def _auto_stop(self):
         self._add_log('24-hour runtime limit reached. Auto-stopping.', True)
         self.stop()
 
-    def stop(self):
-        with bot_lock:
-            if self.process and self.process.poll() is None:
-                self.stop_event.set()
-                try:
-                    # Try graceful termination
-                    if hasattr(os, 'setsid'):
-                        os.killpg(os.getpgid(self.process.pid), signal.SIGTERM)
-                    else:
-                        self.process.terminate()
-                    self.process.wait(timeout=5)
-                except:
-                    # Force kill
-                    if hasattr(os, 'setsid'):
-                        os.killpg(os.getpgid(self.process.pid), signal.SIGKILL)
-                    else:
-                        self.process.kill()
-                self.process = None
+    def _signal_stop(self, run, process):
+        """Send SIGTERM to the process group and arm the SIGKILL deadline."""
+        with self._lock:
+            if run.kill_deadline is None:
+                run.kill_deadline = time.monotonic() + STOP_TIMEOUT
+        try:
+            if hasattr(os, 'setsid'):
+                os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+            else:
+                process.terminate()
+        except OSError:
+            pass
+
+    def _force_kill(self, run):
+        process = run.process
+        if not process or process.poll() is not None:
+            return
+        self._add_log(f'Bot did not exit within {STOP_TIMEOUT}s, killing', True)
+        try:
+            if hasattr(os, 'setsid'):
+                os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+            else:
+                process.kill()
+        except OSError:
+            pass
+
+    def stop(self, update_db=True, wait=False, timeout=None):
+        """Signal the bot to stop and return without waiting for it to exit.
+
+        The supervisor escalates to SIGKILL after STOP_TIMEOUT. Pass
+        wait=True to block until the process group is gone; the return
+        value is then False if it had not exited within timeout.
+        """
+        process = restart_job = None
+        with self._lock:
+            run = self._run
             self.status = 'STOPPED'
+            if run:
+                run.stop_event.set()
+                run.update_db = update_db
+                process = run.process
+                restart_job = run.restart_job
+                run.restart_job = None
+        if restart_job:
+            restart_job.complete_item(self.bot_id, False, 'Cancelled by stop')
+        if process and process.poll() is None:
+            self._signal_stop(run, process)
+        if update_db:
             self._update_db_status('STOPPED')
-            if self.auto_stop_timer:
-                self.auto_stop_timer.cancel()
-            self._add_log('Bot stopped by user', False)
+        self._add_log('Bot stopped by user', False)
+        if wait:
+            return self.wait_stopped(timeout)
+        return True
+
+    def wait_stopped(self, timeout=None):
+        run = self._run
+        return run is None or run.exited.wait(timeout)
+
+    def restart(self, owner_id=None):
+        """Schedule a restart and return its Job without waiting.
+
+        The supervisor thread starts the bot again as soon as the old
+        process group has exited.
+        """
+        job = jobs.create_job('restart', [self.bot_id], owner_id)
+        metrics.bot_restarts.inc(reason='manual')
+        run = self._run
+        if run:
+            job.update(self.bot_id, 'stopping')
+            self._add_log('Restarting bot...', False)
+            self.stop(update_db=False)
+            with self._lock:
+                pending = self._run is run
+                if pending:
+                    run.restart_job = job
+                    # start() counts the row against the plan; release it on exit
+                    run.update_db = True
+            if pending:
+                return job
+        job.update(self.bot_id, 'starting')
+        success, msg = self.start()
+        job.complete_item(self.bot_id, success, msg)
+        return job
 
     def _add_log(self, line, is_error=False):
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         escaped = escape_log_output(line)
-        self.log_queue.append((timestamp, escaped, is_error))
+        with self._lock:
+            # Append and count together so readers can map seq to position
+            if self.log_queue is None:
+                self.log_queue = deque(maxlen=LOG_BUFFER_SIZE)
+            self.log_queue.append((timestamp, escaped, is_error))
+            self.log_seq += 1
         # For spam detection
-        if is_error:
-            self.log_timestamps.append(time.time())
-            if security.check_spam_logs(self.log_timestamps):
-                self._add_log('Spam detected! Bot will be stopped.', True)
+        run = self._run
+        if is_error and run and not run.stop_event.is_set():
+            run.log_timestamps.append(time.time())
+            if security.check_spam_logs(run.log_timestamps):
                 self.stop()
+                self._add_log('Spam detected! Bot stopped.', True)
 
     def get_logs(self, max_lines=500):
-        lines = list(self.log_queue)[-max_lines:]
-        return lines
+        return self.get_logs_since(None, max_lines)[0]
 
-    def _monitor_resources(self):
-        """Update CPU and RAM usage every 2 seconds."""
-        while self.status == 'RUNNING' and self.process and self.process.poll() is None:
-            try:
-                p = psutil.Process(self.process.pid)
-                self.cpu_usage = p.cpu_percent(interval=0.1)
-                self.ram_usage = p.memory_info().rss // (1024 * 1024)  # MB
-                
-                # Check against plan limits
-                limits = get_user_limits(self.user_id)
-                if self.cpu_usage > limits['max_cpu']:
-                    self._add_log(f'CPU usage {self.cpu_usage}% exceeds limit ({limits["max_cpu"]}%). Stopping bot.', True)
-                    self.stop()
-                if self.ram_usage > limits['max_ram_mb']:
-                    self._add_log(f'RAM usage {self.ram_usage}MB exceeds limit ({limits["max_ram_mb"]}MB). Stopping bot.', True)
-                    self.stop()
-            except:
-                pass
-            time.sleep(2)
+    def get_logs_since(self, since=None, max_lines=500):
+        """(lines, seq): the newest max_lines lines logged after sequence
+        number since, and the sequence number of the last line.
+
+        A since ahead of seq (the bot was re-registered) returns the full
+        tail, so clients reset when the returned seq is below theirs.
+        """
+        with self._lock:
+            seq = self.log_seq
+            log_queue = self.log_queue
+            if not log_queue:
+                return [], seq
+            count = min(len(log_queue), max_lines)
+            if since is not None and 0 <= since <= seq:
+                count = min(count, seq - since)
+            # Walk from the newest end: O(count), not O(buffer)
+            lines = list(islice(reversed(log_queue), count))
+        lines.reverse()
+        return lines, seq
+
+    def _tick(self, run, now):
+        """One supervisor pass: kill escalation, runtime limit, stdin, sampling."""
+        if run.kill_deadline is not None and now >= run.kill_deadline:
+            run.kill_deadline = None
+            self._force_kill(run)
+        if run.runtime_deadline is not None and now >= run.runtime_deadline and not run.stop_event.is_set():
+            run.runtime_deadline = None
+            self._auto_stop()
+        if run.commands:
+            self._flush_commands(run)
+        if now >= run.next_sample:
+            run.next_sample = now + SAMPLE_INTERVAL
+            self._sample(run, now)
+            if self.health is not None:
+                self._check_health(run, now)
+
+    def _sample(self, run, now):
+        """Update CPU and RAM usage and enforce the plan limits."""
+        import psutil  # only the supervisor needs it; keeps it off the import path
+        process = run.process
+        if self.status != 'RUNNING' or not process or process.poll() is not None:
+            return
+        try:
+            started = time.perf_counter()
+            if run.ps is None or run.ps.pid != process.pid:
+                run.ps = psutil.Process(process.pid)
+                run.ps.cpu_percent(None)  # first call only primes the counter
+                # Meter from process start so the first interval isn't lost
+                run.cpu_time = 0.0
+                run.sampled_at = now - max(0.0, time.time() - run.ps.create_time())
+            self.cpu_usage = run.ps.cpu_percent(None)
+            self.ram_usage = run.ps.memory_info().rss // (1024 * 1024)  # MB
+            times = run.ps.cpu_times()
+            metrics.monitor_latency.observe(time.perf_counter() - started)
+        except psutil.Error:
+            return
+
+        # Meter consumption since the previous sample
+        cpu_time = times.user + times.system
+        usage.record(self.user_id, self.bot_id, max(0.0, cpu_time - run.cpu_time),
+                     self.ram_usage, now - run.sampled_at)
+        if cpu_time > run.cpu_time:
+            run.last_cpu = now
+        run.cpu_time, run.sampled_at = cpu_time, now
+
+        # Check against plan limits
+        if now - run.limits_at > LIMITS_REFRESH:
+            run.limits = get_user_limits(self.user_id)
+            run.limits_at = now
+        limits = run.limits
+        if self.cpu_usage > limits['max_cpu']:
+            self._add_log(f'CPU usage {self.cpu_usage}% exceeds limit ({limits["max_cpu"]}%). Stopping bot.', True)
+            self.stop()
+        elif self.ram_usage > limits['max_ram_mb']:
+            self._add_log(f'RAM usage {self.ram_usage}MB exceeds limit ({limits["max_ram_mb"]}MB). Stopping bot.', True)
+            self.stop()
+
+    def _check_health(self, run, now):
+        """Kill the process if a liveness check fails; _supervise restarts it."""
+        process = run.process
+        if (run.hung or run.stop_event.is_set() or self.status != 'RUNNING'
+                or not process or process.poll() is not None):
+            return
+        reason = self.health.failure(now, run.last_output, run.last_cpu, run.last_heartbeat)
+        if reason is None:
+            return
+        run.hung = reason
+        self.hang_count += 1
+        self.error_reason = reason
+        self._add_log(f'{reason}; bot looks hung, restarting it', True)
+        self._signal_stop(run, process)
+
+    def set_health(self, check):
+        """Apply new liveness settings; a running bot gets fresh timers."""
+        self.health = check
+        run = self._run
+        if run is not None:
+            run.last_output = run.last_cpu = run.last_heartbeat = time.monotonic()
 
     def _update_db_status(self, status):
         from models import get_db
@@ -238,13 +545,53 @@ class BotProcess:
         conn.close()
 
     def send_command(self, cmd):
-        if self.process and self.process.poll() is None and self.process.stdin:
-            sanitized = security.sanitize_input(cmd)
-            self.process.stdin.write(sanitized + '\n')
-            self.process.stdin.flush()
-            self._add_log(f'> {sanitized}', False)
-            return True
-        return False
+        return self.send_commands([cmd])[0]
+
+    def send_commands(self, cmds):
+        """Queue stdin lines for the supervisor to write; never blocks.
+
+        Returns a Command per line. A bot that isn't running or whose
+        queue is full gets its commands dropped immediately.
+        """
+        commands = [Command(self, security.sanitize_input(cmd or '')) for cmd in cmds]
+        with self._lock:
+            run = self._run
+            for command in commands:
+                if run is None or run.stop_event.is_set():
+                    command.drop('Bot not running')
+                elif len(run.commands) >= COMMAND_QUEUE_SIZE:
+                    command.drop('Command queue full')
+                else:
+                    run.commands.append(command)
+        _remember_commands(commands)
+        if any(command.status == 'queued' for command in commands):
+            _supervisor_wakeup.set()
+        return commands
+
+    def _flush_commands(self, run):
+        """Write queued commands to stdin without blocking (supervisor only)."""
+        process = run.process
+        if process is None:
+            return  # not spawned yet; keep them queued
+        if process.poll() is not None:
+            _drop_commands(run, 'Bot exited')
+            return
+        while run.commands:
+            command = run.commands[0]
+            try:
+                written = os.write(process.stdin.fileno(), command.pending)
+            except BlockingIOError:
+                return  # pipe full: the bot isn't reading; retry next pass
+            except (OSError, ValueError):
+                _drop_commands(run, 'stdin closed')
+                return
+            command.pending = command.pending[written:]
+            if command.pending:
+                return
+            run.commands.popleft()
+            command.status = 'written'
+            command.written_at = time.time()
+            self._add_log(f'> {command.text}', False)
 
     def get_resources(self):
         return {
@@ -252,24 +599,238 @@ class BotProcess:
             'ram': self.ram_usage
         }
 
+    def get_state(self, now=None):
+        """Everything the dashboard shows for this bot, from memory."""
+        running = self.status == 'RUNNING'
+        uptime = None
+        if running and self.start_time:
+            uptime = int(((now or datetime.now()) - self.start_time).total_seconds())
+        return {
+            'id': self.bot_id,
+            'bot_name': self.bot_name,
+            'status': self.status,
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'uptime_seconds': uptime,
+            'restart_count': self.restart_count,
+            'hang_count': self.hang_count,
+            'error_reason': self.error_reason,
+            **(self.get_resources() if running else {'cpu': 0, 'ram': 0})
+        }
+
+    # Versions are fingerprints of the in-memory fields a client can see,
+    # so they change exactly when the corresponding payload does.
+    @property
+    def state_version(self):
+        return fingerprint((self.bot_name, self.status, self.start_time, self.restart_count,
+                            self.hang_count, self.error_reason))
+
+    @property
+    def resource_version(self):
+        return fingerprint((self.status, round(self.cpu_usage, 1), self.ram_usage))
+
+# ------------------ Supervisor ------------------
+# A single thread looks after every running bot: it escalates stops to
+# SIGKILL, enforces the runtime limit, writes queued stdin commands and
+# samples CPU/RAM.
+_running = set()
+_running_lock = threading.Lock()
+_supervisor_thread = None
+_supervisor_wakeup = threading.Event()  # set to run a pass before the interval is up
+
+def _track_running(bot):
+    global _supervisor_thread
+    with _running_lock:
+        _running.add(bot)
+        if _supervisor_thread is None or not _supervisor_thread.is_alive():
+            _supervisor_thread = threading.Thread(target=_supervisor_loop, name='bot-supervisor', daemon=True)
+            _supervisor_thread.start()
+
+def _supervisor_loop():
+    while True:
+        _supervisor_wakeup.wait(SUPERVISOR_INTERVAL)
+        _supervisor_wakeup.clear()
+        with _running_lock:
+            bots = list(_running)
+        now = time.monotonic()
+        for bot in bots:
+            run = bot._run
+            if run is None:
+                with _running_lock:
+                    # Re-check under the lock: start() may have just run
+                    if bot._run is None:
+                        _running.discard(bot)
+                continue
+            try:
+                bot._tick(run, now)
+            except Exception:
+                # One misbehaving bot must not take the supervisor down
+                pass
+
+# ------------------ Command status ------------------
+_commands = OrderedDict()
+_commands_lock = threading.Lock()
+
+def _remember_commands(commands):
+    with _commands_lock:
+        for command in commands:
+            _commands[command.id] = command
+        while len(_commands) > MAX_COMMANDS:
+            _commands.popitem(last=False)
+
+def get_command(command_id):
+    return _commands.get(command_id)
+
+def _drop_commands(run, detail):
+    # popleft until empty: the supervisor may be draining the same deque
+    while True:
+        try:
+            command = run.commands.popleft()
+        except IndexError:
+            return
+        command.drop(detail)
+
+# ------------------ Registry ------------------
+def _bot_key(bot_id):
+    try:
+        return int(bot_id)
+    except (TypeError, ValueError):
+        return bot_id
+
+metrics.running_bots.set_function(lambda: sum(1 for bot in iter_bots() if bot.status == 'RUNNING'))
+metrics.supervisor_threads.set_function(
+    lambda: sum(1 for t in threading.enumerate() if t.name.startswith('bot-')))
+
 def get_bot_manager(user_id, bot_id):
-    with bot_lock:
-        if user_id in user_bots and bot_id in user_bots[user_id]:
-            return user_bots[user_id][bot_id]
-    return None
+    bot_id = _bot_key(bot_id)
+    bots = user_bots.get(user_id)
+    if bots:
+        manager = bots.get(bot_id)
+        if manager:
+            return manager
+    return _hydrate(user_id, bot_id)
+
+def find_bot_manager(user_id, bot_id):
+    """The registered manager for a bot, or None; never loads it from the DB."""
+    return user_bots.get(user_id, {}).get(_bot_key(bot_id))
+
+# Set by cluster.py in coordinator mode: returns a proxy for a bot placed
+# on another node, or None to manage the bot in this process
+placement_resolver = None
+
+def _new_manager(user_id, bot_id, username, bot_name, status=None):
+    manager = None
+    if placement_resolver is not None:
+        manager = placement_resolver(user_id, bot_id, username, bot_name)
+    if manager is None:
+        manager = BotProcess(user_id, bot_id, username, bot_name)
+    if status:
+        # Until it is started here, the row is all we know (e.g. ERROR
+        # after max restarts)
+        manager.status = status
+    return manager
+
+def _hydrate(user_id, bot_id):
+    """Load a bot that isn't in the registry yet from the bots table."""
+    if not isinstance(bot_id, int):
+        return None
+    from models import get_db
+    conn = get_db()
+    c = conn.cursor()
+    row = c.execute('''
+        SELECT bots.bot_name, bots.status, users.username FROM bots
+        JOIN users ON users.id = bots.user_id
+        WHERE bots.id = ? AND bots.user_id = ?
+    ''', (bot_id, user_id)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    return _register(_new_manager(user_id, bot_id, row['username'], row['bot_name'], row['status']))
+
+def _register(manager, replace=False):
+    with registry_lock:
+        bots = user_bots.get(manager.user_id, {})
+        existing = bots.get(manager.bot_id)
+        if existing and not replace:
+            return existing
+        bots = dict(bots)
+        bots[manager.bot_id] = manager
+        user_bots[manager.user_id] = bots
+    return manager
 
 def create_bot_manager(user_id, bot_id, username, bot_name):
-    with bot_lock:
-        if user_id not in user_bots:
-            user_bots[user_id] = {}
-        user_bots[user_id][bot_id] = BotProcess(user_id, bot_id, username, bot_name)
-        return user_bots[user_id][bot_id]
+    return _register(BotProcess(user_id, _bot_key(bot_id), username, bot_name), replace=True)
 
 def delete_bot_manager(user_id, bot_id):
-    with bot_lock:
-        if user_id in user_bots and bot_id in user_bots[user_id]:
-            # Ensure bot is stopped
-            bot = user_bots[user_id][bot_id]
-            if bot.status == 'RUNNING':
-                bot.stop()
-            del user_bots[user_id][bot_id]
\ No newline at end of file
+    bot_id = _bot_key(bot_id)
+    with registry_lock:
+        bots = dict(user_bots.get(user_id, {}))
+        bot = bots.pop(bot_id, None)
+        user_bots[user_id] = bots
+    metrics.bot_log_lines.remove(bot_id=bot_id)
+    # Ensure bot is stopped
+    if bot and bot.active:
+        bot.stop()
+
+def get_user_bots(user_id):
+    return list(user_bots.get(user_id, {}).values())
+
+_loaded_users = set()
+
+def load_user_bots(user_id):
+    """Every bot of a user, hydrating the registry from the DB once."""
+    if user_id not in _loaded_users:
+        from models import get_db
+        conn = get_db()
+        c = conn.cursor()
+        rows = c.execute('''
+            SELECT bots.id, bots.bot_name, bots.status, users.username FROM bots
+            JOIN users ON users.id = bots.user_id
+            WHERE bots.user_id = ?
+        ''', (user_id,)).fetchall()
+        conn.close()
+        for row in rows:
+            _register(_new_manager(user_id, row['id'], row['username'], row['bot_name'], row['status']))
+        _loaded_users.add(user_id)
+    return get_user_bots(user_id)
+
+def iter_bots():
+    """Snapshot of every registered bot, safe to use without locking."""
+    return [bot for bots in list(user_bots.values()) for bot in bots.values()]
+
+def remove_user_bots(user_id):
+    _loaded_users.discard(user_id)
+    with registry_lock:
+        return list(user_bots.pop(user_id, {}).values())
+
+def mark_bots_stopped(bot_ids):
+    """Write STOPPED for many bots in a single transaction."""
+    if not bot_ids:
+        return
+    from models import get_db
+    conn = get_db()
+    c = conn.cursor()
+    c.executemany('UPDATE bots SET status = ? WHERE id = ?', [('STOPPED', bot_id) for bot_id in bot_ids])
+    conn.commit()
+    conn.close()
+
+def stop_bots_async(bots, kind='stop_bots', owner_id=None, on_complete=None):
+    """Stop bots concurrently on the job pool; returns the Job immediately."""
+    bots = {bot.bot_id: bot for bot in bots}
+
+    def stop_one(bot_id):
+        bot = bots[bot_id]
+        if not bot.active:
+            return True, 'not running'
+        if not bot.stop(update_db=False, wait=True, timeout=STOP_TIMEOUT + 5):
+            return False, 'timed out'
+        return True, 'stopped'
+
+    def complete(job):
+        # Bots that timed out are SIGKILLed by the supervisor and won't write either
+        stopped = [bot_id for bot_id in bots
+                   if job.items[str(bot_id)]['detail'] in ('stopped', 'timed out')]
+        mark_bots_stopped(stopped)
+        if on_complete:
+            on_complete(job)
+
+    return jobs.run_job(kind, list(bots), stop_one, owner_id, complete)
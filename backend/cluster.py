@@ -0,0 +1,468 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from flask import Blueprint, request, jsonify
+from models import get_db
+from auth import admin_required
+from plan_manager import get_user_limits, get_user_plan
+import bot_manager
+from bot_manager import BotProcess, Command, STOP_TIMEOUT
+import jobs
+import metrics
+
+# ------------------ Cluster mode ------------------
+# With CLUSTER_MODE=coordinator the panel places bots on supervisor nodes
+# (backend/node.py) that register through heartbeats. Nodes share the
+# panel's DB_PATH and UPLOAD_DIR (same host or a shared volume) and are
+# authenticated with CLUSTER_TOKEN. Without nodes, or when none has room,
+# bots run in the panel process as before.
+CLUSTER_MODE = os.environ.get('CLUSTER_MODE', '')
+CLUSTER_TOKEN = os.environ.get('CLUSTER_TOKEN', '')
+LOCAL_FALLBACK = os.environ.get('CLUSTER_LOCAL_FALLBACK', '1') == '1'
+TOKEN_HEADER = 'X-Cluster-Token'
+HEARTBEAT_INTERVAL = 2   # seconds between node heartbeats
+NODE_TIMEOUT = 15        # seconds without a heartbeat before a node is drained
+RPC_TIMEOUT = 5
+# Plan CPU limits are caps, and bots rarely sit at them: placement reserves
+# this share of the cap per bot (RAM is reserved in full)
+CPU_SHARE = 0.25
+
+cluster_bp = Blueprint('cluster', __name__)
+
+class NodeUnavailable(Exception):
+    pass
+
+class Node:
+    __slots__ = (
+        'id', 'url', 'plans', 'cpu_count', 'cpu_percent', 'ram_total_mb', 'ram_available_mb',
+        'reserved_cpu', 'reserved_ram_mb', 'bot_count', 'last_seen', 'draining'
+    )
+
+    def __init__(self, node_id, url):
+        self.id = node_id
+        self.url = url.rstrip('/')
+        self.plans = None  # None accepts every plan
+        self.cpu_count = 1
+        self.cpu_percent = 0.0
+        self.ram_total_mb = 0
+        self.ram_available_mb = 0
+        self.reserved_cpu = 0.0    # placed since the last heartbeat
+        self.reserved_ram_mb = 0
+        self.bot_count = 0
+        self.last_seen = 0
+        self.draining = False
+
+    @property
+    def alive(self):
+        return time.monotonic() - self.last_seen < NODE_TIMEOUT
+
+    def headroom(self):
+        """(cpu percent-of-one-core, ram MB) still free on this node."""
+        cpu = self.cpu_count * (100 - self.cpu_percent) - self.reserved_cpu
+        return cpu, self.ram_available_mb - self.reserved_ram_mb
+
+    def to_dict(self):
+        cpu, ram = self.headroom()
+        return {
+            'node_id': self.id,
+            'url': self.url,
+            'plans': self.plans,
+            'cpu_count': self.cpu_count,
+            'cpu_percent': self.cpu_percent,
+            'ram_total_mb': self.ram_total_mb,
+            'ram_available_mb': self.ram_available_mb,
+            'cpu_headroom': round(cpu, 1),
+            'ram_headroom_mb': ram,
+            'bots': self.bot_count,
+            'alive': self.alive,
+            'draining': self.draining
+        }
+
+_nodes = {}          # node_id -> Node
+_placements = {}     # bot_id -> node_id, mirrors the bot_placements table
+_cluster_lock = threading.Lock()
+_monitor_thread = None
+
+def is_coordinator():
+    return CLUSTER_MODE == 'coordinator' and bool(CLUSTER_TOKEN)
+
+def _authorized():
+    return bool(CLUSTER_TOKEN) and request.headers.get(TOKEN_HEADER) == CLUSTER_TOKEN
+
+def call_node(node, method, path, body=None, timeout=RPC_TIMEOUT):
+    """JSON RPC to a node; raises NodeUnavailable on any transport error."""
+    import urllib.error
+    import urllib.request  # only needed in coordinator mode
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(node.url + path, data=data, method=method, headers={
+        'Content-Type': 'application/json',
+        TOKEN_HEADER: CLUSTER_TOKEN
+    })
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read() or b'{}')
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise NodeUnavailable(f'Node {node.id} unavailable: {e}')
+
+# ------------------ Remote bots ------------------
+class RemoteCommand(Command):
+    """Coordinator-side mirror of a command queued on a node."""
+    __slots__ = ('node_id',)
+
+def refresh_commands(commands):
+    """Pull the delivery status of queued remote commands, one RPC per node."""
+    by_node = {}
+    for command in commands:
+        if isinstance(command, RemoteCommand) and command.status == 'queued':
+            by_node.setdefault(command.node_id, {})[command.id] = command
+    for node_id, pending in by_node.items():
+        node = _nodes.get(node_id)
+        if node is None:
+            continue
+        try:
+            result = call_node(node, 'GET', f'/node/commands?ids={",".join(pending)}')
+        except NodeUnavailable:
+            continue
+        for remote in result.get('commands', []):
+            command = pending.get(remote['command_id'])
+            if command is not None:
+                command.status = remote['status']
+                command.detail = remote['detail']
+                command.written_at = remote['written_at']
+
+class RemoteBotProxy(BotProcess):
+    """Stands in for a bot running on another node.
+
+    Status and resources come from the node's heartbeats, so reads stay
+    in memory; control calls, logs and commands go to the node over HTTP.
+    """
+    __slots__ = ('node_id',)
+
+    def __init__(self, user_id, bot_id, username, bot_name, node_id):
+        super().__init__(user_id, bot_id, username, bot_name)
+        self.node_id = node_id
+
+    def _call(self, method, action, body=None, timeout=RPC_TIMEOUT):
+        node = _nodes.get(self.node_id)
+        if node is None:
+            raise NodeUnavailable(f'Node {self.node_id} is not registered')
+        return call_node(node, method, f'/node/bots/{self.bot_id}/{action}', body, timeout)
+
+    def apply_state(self, state):
+        self.status = state['status']
+        self.start_time = datetime.fromisoformat(state['start_time']) if state.get('start_time') else None
+        self.restart_count = state['restart_count']
+        self.hang_count = state.get('hang_count', 0)
+        self.error_reason = state['error_reason']
+        self.cpu_usage = state['cpu']
+        self.ram_usage = state['ram']
+        self.log_seq = state.get('log_seq', self.log_seq)
+
+    def start(self):
+        try:
+            result = self._call('POST', 'start', {
+                'user_id': self.user_id, 'username': self.username, 'bot_name': self.bot_name
+            })
+        except NodeUnavailable as e:
+            return False, str(e)
+        self.apply_state(result['state'])
+        return result['success'], result['message']
+
+    def stop(self, update_db=True, wait=False, timeout=None):
+        timeout = STOP_TIMEOUT + 5 if timeout is None else timeout
+        try:
+            result = self._call('POST', 'stop', {'update_db': update_db, 'wait': wait, 'timeout': timeout},
+                                timeout=RPC_TIMEOUT + (timeout if wait else 0))
+        except NodeUnavailable:
+            return False
+        self.apply_state(result['state'])
+        return result['stopped'] if wait else True
+
+    def wait_stopped(self, timeout=None):
+        return self.status != 'RUNNING'
+
+    def restart(self, owner_id=None):
+        metrics.bot_restarts.inc(reason='manual')
+
+        def restart_one(bot_id):
+            if self.status == 'RUNNING' and not self.stop(wait=True):
+                return False, 'Bot did not stop'
+            return self.start()
+        return jobs.run_job('restart', [self.bot_id], restart_one, owner_id)
+
+    def get_logs_since(self, since=None, max_lines=500):
+        query = f'max_lines={int(max_lines)}' + (f'&since={int(since)}' if since is not None else '')
+        try:
+            result = self._call('GET', f'logs?{query}')
+        except NodeUnavailable:
+            return [], self.log_seq
+        return [tuple(line) for line in result['logs']], result['seq']
+
+    def send_commands(self, cmds):
+        commands = [RemoteCommand(self, cmd or '') for cmd in cmds]
+        try:
+            result = self._call('POST', 'commands', {'commands': [c.text for c in commands]})
+            for command, remote in zip(commands, result['commands']):
+                # Adopt the node's id so status lookups can be forwarded
+                command.id = remote['command_id']
+                command.text = remote['command']
+                command.status = remote['status']
+                command.detail = remote['detail']
+                command.written_at = remote['written_at']
+        except NodeUnavailable as e:
+            for command in commands:
+                command.drop(str(e))
+        for command in commands:
+            command.node_id = self.node_id
+        bot_manager._remember_commands(commands)
+        return commands
+
+# ------------------ Placement ------------------
+def _resolve(user_id, bot_id, username, bot_name):
+    node_id = _placements.get(bot_id)
+    if node_id is None or node_id not in _nodes:
+        return None
+    return RemoteBotProxy(user_id, bot_id, username, bot_name, node_id)
+
+def _save_placement(bot_id, user_id, node_id):
+    conn = get_db()
+    c = conn.cursor()
+    if node_id is None:
+        c.execute('DELETE FROM bot_placements WHERE bot_id = ?', (bot_id,))
+    else:
+        c.execute('INSERT OR REPLACE INTO bot_placements (bot_id, user_id, node_id) VALUES (?, ?, ?)',
+                  (bot_id, user_id, node_id))
+    conn.commit()
+    conn.close()
+    with _cluster_lock:
+        if node_id is None:
+            _placements.pop(bot_id, None)
+        else:
+            _placements[bot_id] = node_id
+
+def choose_node(user_id, exclude=()):
+    """Live node with the most headroom for this user's plan, or None."""
+    plan = get_user_plan(user_id)
+    limits = get_user_limits(user_id)
+    need_cpu, need_ram = limits['max_cpu'] * CPU_SHARE, limits['max_ram_mb']
+    best, best_score = None, 0
+    for node in list(_nodes.values()):
+        if node.draining or not node.alive or node.id in exclude:
+            continue
+        if node.plans is not None and plan not in node.plans:
+            continue
+        cpu, ram = node.headroom()
+        if cpu < need_cpu or ram < need_ram:
+            continue
+        # How many more bots like this one would fit, by the scarcer resource
+        score = min(cpu / need_cpu, ram / need_ram)
+        if score > best_score:
+            best, best_score = node, score
+    if best is not None:
+        with _cluster_lock:
+            best.reserved_cpu += need_cpu
+            best.reserved_ram_mb += need_ram
+    return best
+
+def place(manager, exclude=()):
+    """Registry entry that should run this bot: a proxy on the chosen node,
+    or a local BotProcess when no node fits (and local fallback is on).
+
+    Returns (manager, error).
+    """
+    if isinstance(manager, RemoteBotProxy):
+        node = _nodes.get(manager.node_id)
+        if node is not None and node.alive and not node.draining and node.id not in exclude:
+            return manager, None
+    node = choose_node(manager.user_id, exclude)
+    if node is None:
+        if not LOCAL_FALLBACK:
+            return None, 'No cluster node has capacity for this bot'
+        if isinstance(manager, RemoteBotProxy):
+            _save_placement(manager.bot_id, manager.user_id, None)
+            manager = bot_manager._register(
+                BotProcess(manager.user_id, manager.bot_id, manager.username, manager.bot_name), replace=True)
+        return manager, None
+    if not isinstance(manager, RemoteBotProxy) and manager.active:
+        return manager, None  # running (or stopping) here; don't move it implicitly
+    _save_placement(manager.bot_id, manager.user_id, node.id)
+    proxy = RemoteBotProxy(manager.user_id, manager.bot_id, manager.username, manager.bot_name, node.id)
+    return bot_manager._register(proxy, replace=True), None
+
+def hand_off(bot):
+    """Move a bot running in this process to a node, e.g. before the
+    coordinator shuts down. Returns (success, detail).
+    """
+    node = choose_node(bot.user_id)
+    if node is None:
+        return False, 'No cluster node has capacity for this bot'
+    bot.stop(update_db=False, wait=True, timeout=STOP_TIMEOUT + 5)
+    # The node counts RUNNING rows against the owner's plan; clear this one
+    bot_manager.mark_bots_stopped([bot.bot_id])
+    _save_placement(bot.bot_id, bot.user_id, node.id)
+    proxy = bot_manager._register(
+        RemoteBotProxy(bot.user_id, bot.bot_id, bot.username, bot.bot_name, node.id), replace=True)
+    success, msg = proxy.start()
+    if not success:
+        _save_placement(bot.bot_id, bot.user_id, None)
+        bot_manager._register(bot, replace=True)
+        return False, msg
+    return True, f'{msg} on {node.id}'
+
+# ------------------ Node membership ------------------
+def _update_node(data):
+    node_id = str(data['node_id'])
+    with _cluster_lock:
+        node = _nodes.get(node_id)
+        if node is None or node.url != data['url'].rstrip('/'):
+            node = _nodes[node_id] = Node(node_id, data['url'])
+        node.plans = data.get('plans') or None
+        node.cpu_count = max(1, int(data.get('cpu_count', 1)))
+        node.cpu_percent = float(data.get('cpu_percent', 0))
+        node.ram_total_mb = int(data.get('ram_total_mb', 0))
+        node.ram_available_mb = int(data.get('ram_available_mb', 0))
+        node.reserved_cpu = 0.0
+        node.reserved_ram_mb = 0
+        node.bot_count = len(data.get('bots', []))
+        node.last_seen = time.monotonic()
+    return node
+
+def _apply_bot_states(node, states):
+    for state in states:
+        bot_id = state['id']
+        manager = bot_manager.user_bots.get(state['user_id'], {}).get(bot_id)
+        if isinstance(manager, RemoteBotProxy) and manager.node_id == node.id:
+            manager.apply_state(state)
+        elif state['status'] == 'RUNNING' and _placements.get(bot_id) in (None, node.id):
+            # A bot the coordinator lost track of (e.g. after a restart): adopt it
+            if _placements.get(bot_id) is None:
+                _save_placement(bot_id, state['user_id'], node.id)
+            proxy = RemoteBotProxy(state['user_id'], bot_id, state['username'], state['bot_name'], node.id)
+            proxy.apply_state(state)
+            bot_manager._register(proxy, replace=True)
+
+def _ensure_monitor():
+    global _monitor_thread
+    with _cluster_lock:
+        if _monitor_thread is None or not _monitor_thread.is_alive():
+            _monitor_thread = threading.Thread(target=_monitor_loop, name='cluster-monitor', daemon=True)
+            _monitor_thread.start()
+
+def _monitor_loop():
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        for node in list(_nodes.values()):
+            if node.alive:
+                continue
+            if node.draining:
+                # Removed earlier and now silent: forget it so it can rejoin
+                with _cluster_lock:
+                    if _nodes.get(node.id) is node:
+                        del _nodes[node.id]
+            else:
+                remove_node(node.id, reachable=False)
+
+def remove_node(node_id, reachable=True, owner_id=None):
+    """Drain a node: stop its bots there and start the ones that were
+    running on other nodes (or locally). Returns the drain Job.
+    """
+    node = _nodes.get(node_id)
+    if node is None:
+        return None
+    node.draining = True
+    bots = [bot for bot in bot_manager.iter_bots()
+            if isinstance(bot, RemoteBotProxy) and bot.node_id == node_id]
+    # Bots placed there but never loaded into the registry only need unpinning
+    for bot_id, placed_on in list(_placements.items()):
+        if placed_on == node_id and bot_id not in {b.bot_id for b in bots}:
+            _save_placement(bot_id, None, None)
+    by_id = {bot.bot_id: bot for bot in bots}
+
+    def move(bot_id):
+        bot = by_id[bot_id]
+        was_running = bot.status == 'RUNNING'
+        if reachable and was_running:
+            bot.stop(update_db=False, wait=True)
+        _save_placement(bot_id, bot.user_id, None)
+        local = BotProcess(bot.user_id, bot.bot_id, bot.username, bot.bot_name)
+        bot_manager._register(local, replace=True)
+        if not was_running:
+            return True, 'unpinned'
+        # A dead node never wrote STOPPED; the stale row would count
+        # against the owner's bot limit and block the restart
+        bot_manager.mark_bots_stopped([bot_id])
+        manager, error = place(local, exclude=(node_id,))
+        if manager is None:
+            bot_manager.mark_bots_stopped([bot_id])
+            return False, error
+        success, msg = manager.start()
+        where = manager.node_id if isinstance(manager, RemoteBotProxy) else 'coordinator'
+        return success, f'{msg} on {where}' if success else msg
+
+    def complete(job):
+        if reachable:
+            # Still heartbeating: keep it registered as draining so it
+            # isn't re-added on the next heartbeat; the monitor drops it
+            # once it goes quiet
+            return
+        with _cluster_lock:
+            if _nodes.get(node_id) is node:
+                del _nodes[node_id]
+
+    return jobs.run_job('drain_node', list(by_id), move, owner_id, complete)
+
+def init_coordinator():
+    """Load placements and hook into the registry (coordinator only)."""
+    conn = get_db()
+    c = conn.cursor()
+    rows = c.execute('SELECT bot_id, node_id FROM bot_placements').fetchall()
+    conn.close()
+    with _cluster_lock:
+        _placements.clear()
+        _placements.update({row['bot_id']: row['node_id'] for row in rows})
+    bot_manager.placement_resolver = _resolve
+
+# ------------------ Routes ------------------
+@cluster_bp.route('/cluster/heartbeat', methods=['POST'])
+def heartbeat():
+    if not is_coordinator() or not _authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    data = request.json
+    node = _update_node(data)
+    if node.draining:
+        return jsonify({'success': True, 'draining': True})
+    _apply_bot_states(node, data.get('bots', []))
+    _ensure_monitor()
+    return jsonify({'success': True, 'draining': False})
+
+@cluster_bp.route('/cluster/leave', methods=['POST'])
+def leave():
+    """A node shutting down: its bots are already stopped, re-place them."""
+    if not is_coordinator() or not _authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    data = request.json
+    for bot_id in data.get('running', []):
+        bot = next((b for b in bot_manager.iter_bots() if b.bot_id == bot_id), None)
+        if isinstance(bot, RemoteBotProxy):
+            bot.status = 'RUNNING'  # restart it elsewhere
+    job = remove_node(str(data.get('node_id')), reachable=False)
+    return jsonify({'success': True, 'job_id': job.id if job else None})
+
+@cluster_bp.route('/admin/cluster/nodes', methods=['GET'])
+@admin_required
+def list_nodes():
+    return jsonify({
+        'enabled': is_coordinator(),
+        'nodes': [node.to_dict() for node in list(_nodes.values())],
+        'placements': len(_placements)
+    })
+
+@cluster_bp.route('/admin/cluster/nodes/<node_id>/remove', methods=['POST'])
+@admin_required
+def remove_node_route(node_id):
+    job = remove_node(node_id, reachable=True)
+    if job is None:
+        return jsonify({'error': 'Node not found'}), 404
+    return jsonify({'success': True, 'job_id': job.id})
@@ -0,0 +1,47 @@
+import gzip
+import zlib
+from flask import request
+
+# Transparent gzip for JSON and text responses. Static assets are
+# precompressed by assets.py and already carry Content-Encoding.
+COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies aren't worth the CPU
+COMPRESS_LEVEL = 6
+COMPRESSIBLE_TYPES = ('application/json', 'application/javascript', 'text/')
+
+def accepts_gzip():
+    return request.accept_encodings['gzip'] > 0
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def compress_response(response):
+    """after_request hook: gzip the body if the client accepts it."""
+    if (response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or not response.mimetype.startswith(COMPRESSIBLE_TYPES)):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or not accepts_gzip():
+        return response
+    if response.is_streamed:
+        # Compress chunk by chunk; the length isn't known up front
+        response.response = _gzip_stream(response.response)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(gzip.compress(data, COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    # The compressed body is a different byte sequence: weaken the ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,91 @@
+from models import get_db
+
+# ------------------ Liveness checks ------------------
+# Optional per-bot checks, evaluated by the supervisor with every resource
+# sample. A bot that fails one is killed and goes through the same restart
+# policy as a crash. All checks are off unless configured. The heartbeat is
+# a plain substring, not a regex: it runs on every output line inside the
+# panel process, where a backtracking pattern would stall every bot.
+MAX_MINUTES = 24 * 60
+MAX_PATTERN_LENGTH = 200
+MINUTE_FIELDS = ('no_output_minutes', 'zero_cpu_minutes', 'heartbeat_minutes')
+
+class HealthCheck:
+    """Parsed liveness settings of one bot; thresholds are in seconds."""
+    __slots__ = ('no_output', 'zero_cpu', 'heartbeat', 'pattern')
+
+    def __init__(self, no_output_minutes=None, zero_cpu_minutes=None,
+                 heartbeat_pattern=None, heartbeat_minutes=None):
+        self.no_output = no_output_minutes * 60 if no_output_minutes else None
+        self.zero_cpu = zero_cpu_minutes * 60 if zero_cpu_minutes else None
+        self.pattern = heartbeat_pattern or None
+        self.heartbeat = heartbeat_minutes * 60 if heartbeat_minutes and self.pattern else None
+
+    def failure(self, now, last_output, last_cpu, last_heartbeat):
+        """Why the bot looks hung at monotonic time now, or None."""
+        if self.no_output and now - last_output > self.no_output:
+            return f'No output for {self.no_output // 60} minutes'
+        if self.zero_cpu and now - last_cpu > self.zero_cpu:
+            return f'No CPU time used for {self.zero_cpu // 60} minutes'
+        if self.heartbeat and now - last_heartbeat > self.heartbeat:
+            return f'No heartbeat line containing "{self.pattern}" for {self.heartbeat // 60} minutes'
+        return None
+
+def validate(data):
+    """Settings from a request body; returns (config, error)."""
+    config = {}
+    for field in MINUTE_FIELDS:
+        value = data.get(field)
+        if value in (None, '', 0):
+            config[field] = None
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return None, f'{field} must be a whole number of minutes'
+        if not 0 <= value <= MAX_MINUTES:
+            return None, f'{field} must be between 0 and {MAX_MINUTES}'
+        config[field] = value or None
+    pattern = data.get('heartbeat_pattern') or None
+    if pattern is not None:
+        if not isinstance(pattern, str) or len(pattern) > MAX_PATTERN_LENGTH:
+            return None, f'heartbeat_pattern must be at most {MAX_PATTERN_LENGTH} characters'
+        if not config['heartbeat_minutes']:
+            return None, 'heartbeat_minutes is required with heartbeat_pattern'
+    config['heartbeat_pattern'] = pattern
+    return config, None
+
+def get_config(bot_id):
+    conn = get_db()
+    c = conn.cursor()
+    row = c.execute('''
+        SELECT no_output_minutes, zero_cpu_minutes, heartbeat_pattern, heartbeat_minutes
+        FROM bot_health WHERE bot_id = ?
+    ''', (bot_id,)).fetchone()
+    conn.close()
+    if not row:
+        return dict.fromkeys(MINUTE_FIELDS + ('heartbeat_pattern',))
+    return dict(row)
+
+def load(bot_id):
+    """HealthCheck for a bot, or None when no check is configured."""
+    config = get_config(bot_id)
+    if not any(config.values()):
+        return None
+    return HealthCheck(**config)
+
+def save(bot_id, config):
+    conn = get_db()
+    c = conn.cursor()
+    if any(config.values()):
+        c.execute('''
+            INSERT OR REPLACE INTO bot_health
+                (bot_id, no_output_minutes, zero_cpu_minutes, heartbeat_pattern, heartbeat_minutes)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (bot_id, config['no_output_minutes'], config['zero_cpu_minutes'],
+              config['heartbeat_pattern'], config['heartbeat_minutes']))
+    else:
+        c.execute('DELETE FROM bot_health WHERE bot_id = ?', (bot_id,))
+    conn.commit()
+    conn.close()
+    return HealthCheck(**config) if any(config.values()) else None
@@ -0,0 +1,117 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Bounded pool shared by all bulk operations
+MAX_WORKERS = 8
+MAX_JOBS = 200  # finished jobs kept for status lookups
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='job')
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+class Job:
+    def __init__(self, kind, items, owner_id=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.owner_id = owner_id
+        self.items = OrderedDict((str(i), {'state': 'pending', 'detail': None}) for i in items)
+        self.created_at = time.time()
+        self.finished_at = None
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        self._remaining = len(self.items)
+
+    def update(self, item, state, detail=None):
+        with self._lock:
+            self.items[str(item)] = {'state': state, 'detail': detail}
+
+    def _item_done(self):
+        with self._lock:
+            self._remaining -= 1
+            done = self._remaining <= 0
+        return done
+
+    def _finish(self):
+        self.finished_at = time.time()
+        self.finished.set()
+
+    def complete_item(self, item, success, detail=None):
+        """Record the final state of an item driven outside the pool."""
+        self.update(item, 'done' if success else 'failed', detail)
+        if self._item_done():
+            self._finish()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def to_dict(self):
+        with self._lock:
+            items = {k: dict(v) for k, v in self.items.items()}
+        counts = {}
+        for v in items.values():
+            counts[v['state']] = counts.get(v['state'], 0) + 1
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'done': self.finished.is_set(),
+            'total': len(items),
+            'counts': counts,
+            'items': items,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+def _register(job):
+    with _jobs_lock:
+        _jobs[job.id] = job
+        # Drop the oldest finished jobs once over the cap
+        while len(_jobs) > MAX_JOBS:
+            oldest_id, oldest = next(iter(_jobs.items()))
+            if not oldest.finished.is_set():
+                break
+            del _jobs[oldest_id]
+
+def create_job(kind, items, owner_id=None):
+    """Register a job whose items are completed by the caller."""
+    job = Job(kind, items, owner_id)
+    _register(job)
+    return job
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def run_job(kind, items, fn, owner_id=None, on_complete=None):
+    """Run fn(item) for every item on the shared pool and return the Job.
+
+    fn returns (success, detail). on_complete(job) runs once after the
+    last item, which is where callers put their batched DB writes.
+    """
+    items = list(OrderedDict((str(i), i) for i in items).values())
+    job = create_job(kind, items, owner_id)
+
+    def complete():
+        try:
+            if on_complete:
+                on_complete(job)
+        finally:
+            job._finish()
+
+    def run_item(item):
+        job.update(item, 'running')
+        try:
+            success, detail = fn(item)
+            job.update(item, 'done' if success else 'failed', detail)
+        except Exception as e:
+            job.update(item, 'failed', str(e))
+        if job._item_done():
+            complete()
+
+    if not items:
+        complete()
+    for item in items:
+        _executor.submit(run_item, item)
+    return job
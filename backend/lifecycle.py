@@ -0,0 +1,110 @@
+import os
+import signal
+import sys
+import time
+from models import get_db
+import bot_manager
+import cluster
+import jobs
+import usage
+
+# ------------------ Startup ------------------
+def reconcile():
+    """Reset bots the DB still calls RUNNING but no process is running.
+
+    Bots run inside the panel process, so after a crash or a hard kill
+    their rows are stale and would count against the owner's plan. In
+    coordinator mode bots placed on nodes keep running and are left alone.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    if cluster.is_coordinator():
+        c.execute('''
+            UPDATE bots SET status = 'STOPPED'
+            WHERE status = 'RUNNING' AND id NOT IN (SELECT bot_id FROM bot_placements)
+        ''')
+    else:
+        c.execute("UPDATE bots SET status = 'STOPPED' WHERE status = 'RUNNING'")
+    count = c.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+# ------------------ Shutdown ------------------
+DRAIN_TIMEOUT = float(os.environ.get('DRAIN_TIMEOUT', 15))  # seconds for bots to exit before SIGKILL
+KILL_GRACE = 2  # seconds to wait for killed process groups to be reaped
+# Coordinator only: move bots running in the panel to nodes instead of stopping them
+DRAIN_HANDOFF = os.environ.get('DRAIN_HANDOFF', '1') == '1'
+
+def _local_running():
+    return [bot for bot in bot_manager.iter_bots()
+            if not isinstance(bot, cluster.RemoteBotProxy) and bot.active]
+
+def drain(timeout=DRAIN_TIMEOUT, handoff=DRAIN_HANDOFF):
+    """Stop accepting starts, then hand off or stop every bot this process
+    runs within timeout seconds. Returns a report of what happened.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    bot_manager.draining.set()
+    bots = _local_running()
+    report = {'handed_off': [], 'stopped': [], 'killed': [], 'failed': {},
+              # Bots already on nodes keep running there
+              'left_on_nodes': sum(1 for bot in bot_manager.iter_bots()
+                                   if isinstance(bot, cluster.RemoteBotProxy) and bot.status == 'RUNNING')}
+
+    if handoff and cluster.is_coordinator() and bots:
+        by_id = {bot.bot_id: bot for bot in bots}
+        job = jobs.run_job('handoff', list(by_id), lambda bot_id: cluster.hand_off(by_id[bot_id]))
+        job.wait(max(0.0, deadline - time.monotonic()))
+        for bot_id, item in job.to_dict()['items'].items():
+            if item['state'] == 'done':
+                report['handed_off'].append(int(bot_id))
+            elif item['state'] == 'failed':
+                report['failed'][int(bot_id)] = item['detail']
+        bots = [bot for bot in bots if bot.bot_id not in report['handed_off']]
+
+    # SIGTERM every process group at once, then wait against one deadline
+    for bot in bots:
+        bot._add_log('Server shutting down', True)
+        bot.stop(update_db=False)
+    stragglers = [bot for bot in bots if not bot.wait_stopped(max(0.0, deadline - time.monotonic()))]
+    for bot in stragglers:
+        run = bot._run
+        if run is not None:
+            bot._force_kill(run)
+    for bot in stragglers:
+        bot.wait_stopped(KILL_GRACE)
+    killed = {bot.bot_id for bot in stragglers}
+    for bot in bots:
+        report['killed' if bot.bot_id in killed else 'stopped'].append(bot.bot_id)
+
+    # Status and usage writes that would otherwise be lost with the process
+    bot_manager.mark_bots_stopped(report['stopped'] + report['killed'])
+    try:
+        report['usage_rows'] = usage.flush(everything=True)
+    except Exception as e:
+        report['failed']['usage'] = str(e)
+    report['seconds'] = round(time.monotonic() - started, 2)
+    return report
+
+def summary(report):
+    return (f"stopped {len(report['stopped'])}, killed {len(report['killed'])}, "
+            f"handed off {len(report['handed_off'])}, failed {len(report['failed'])}, "
+            f"left on nodes {report['left_on_nodes']} in {report['seconds']}s")
+
+def _on_signal(signum, frame):
+    if bot_manager.draining.is_set():
+        # A second signal while draining: give up on a clean exit
+        sys.exit(1)
+    print(f'Received {signal.Signals(signum).name}, draining bots...', file=sys.stderr)
+    report = drain()
+    print(f'Shutdown: {summary(report)}', file=sys.stderr)
+    for bot_id, detail in report['failed'].items():
+        print(f'  {bot_id}: {detail}', file=sys.stderr)
+    sys.exit(0)
+
+def install_signal_handlers():
+    """Drain on SIGTERM/SIGINT; must be called from the main thread."""
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
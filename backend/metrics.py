@@ -0,0 +1,148 @@
+import bisect
+import threading
+
+# Minimal Prometheus-style registry. Recording is a dict lookup plus an
+# add under a per-metric lock, cheap enough to leave on in production.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics = []
+_registry_lock = threading.Lock()
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(_label_key(self.labelnames, labels), None)
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, self.labelnames, key, None, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for name, labelnames, key, extra, value in self._samples():
+            lines.append(f'{name}{_format_labels(labelnames, key, extra)} {value}')
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        super().__init__(name, help_text, labelnames)
+        self._func = func  # computed at scrape time for unlabelled gauges
+
+    def set(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func):
+        self._func = func
+
+    def _samples(self):
+        if self._func is not None:
+            return [(self.name, (), (), None, self._func())]
+        return super()._samples()
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        with self._lock:
+            snapshot = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        samples = []
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                samples.append((f'{self.name}_bucket', self.labelnames, key, f'le="{le}"', cumulative))
+            samples.append((f'{self.name}_sum', self.labelnames, key, None, total))
+            samples.append((f'{self.name}_count', self.labelnames, key, None, count))
+        return samples
+
+def render_latest():
+    """Text exposition format for every registered metric."""
+    with _registry_lock:
+        metrics = list(_metrics)
+    return '\n'.join(m.render() for m in metrics) + '\n'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ------------------ Panel metrics ------------------
+http_requests = Counter('panel_http_requests_total', 'HTTP requests by route, method and status',
+                        ('route', 'method', 'status'))
+http_latency = Histogram('panel_http_request_duration_seconds', 'HTTP request latency by route',
+                         ('route', 'method'))
+db_query_latency = Histogram('panel_db_query_duration_seconds', 'SQLite statement latency by verb',
+                             ('verb',))
+bot_log_lines = Counter('panel_bot_log_lines_total', 'Log lines ingested per bot', ('bot_id',))
+bot_restarts = Counter('panel_bot_restarts_total', 'Bot restarts (manual and crash)', ('reason',))
+bot_crashes = Counter('panel_bot_crashes_total', 'Bot processes that exited with a non-zero code')
+bot_hangs = Counter('panel_bot_hangs_total', 'Bot processes killed by a failed liveness check')
+install_latency = Histogram('panel_requirements_install_duration_seconds', 'pip install duration',
+                            buckets=(1, 5, 10, 30, 60, 120, 300, 600))
+monitor_latency = Histogram('panel_resource_sample_duration_seconds', 'Time spent sampling one bot')
+running_bots = Gauge('panel_running_bots', 'Bots currently in RUNNING state')
+supervisor_threads = Gauge('panel_supervisor_threads', 'Live bot supervisor and monitor threads')
+panel_threads = Gauge('panel_threads', 'Live threads in the panel process', func=threading.active_count)
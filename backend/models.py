@@ -1,17 +1,66 @@
 import sqlite3
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
+import metrics
+import profiling
 
-DB_PATH = os.path.join(os.path.dirname(__file__), 'app.db')
+DB_PATH = os.environ.get('DB_PATH', os.path.join(os.path.dirname(__file__), 'app.db'))
+SCHEMA_VERSION = 2  # bump whenever init_db() creates or seeds something new
+
+def _verb(sql):
+    parts = sql.split(None, 1)
+    return parts[0].upper() if parts else ''
+
+def _record(sql, duration):
+    metrics.db_query_latency.observe(duration, verb=_verb(sql))
+    profiling.record_query(sql, duration)
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records statement latency in the metrics registry."""
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record(sql, time.perf_counter() - start)
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
 
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     return conn
 
+def bootstrap():
+    """Make sure the schema exists; call once per process before serving.
+
+    A database that is already at SCHEMA_VERSION costs a single PRAGMA
+    read, so workers and tools don't redo the CREATE/INSERT work.
+    """
+    conn = get_db()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.close()
+    if version < SCHEMA_VERSION:
+        init_db()
+
 def init_db():
     conn = get_db()
     c = conn.cursor()
+    # Serialize workers that bootstrap at the same time
+    c.execute('BEGIN IMMEDIATE')
+    if c.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        conn.rollback()
+        conn.close()
+        return
     
     # Users table
     c.execute('''
@@ -49,9 +98,48 @@ def init_db():
         )
     ''')
     
+    # Which cluster node runs each bot (only used in coordinator mode)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bot_placements (
+            bot_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            node_id TEXT NOT NULL,
+            placed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(bot_id) REFERENCES bots(id)
+        )
+    ''')
+    
+    # Hourly usage rollups, written in batches by usage.py
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bot_usage (
+            hour INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            bot_id INTEGER NOT NULL,
+            cpu_seconds REAL DEFAULT 0,
+            ram_mb_hours REAL DEFAULT 0,
+            samples INTEGER DEFAULT 0,
+            peak_ram_mb INTEGER DEFAULT 0,
+            PRIMARY KEY(hour, bot_id)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bot_usage_user ON bot_usage(user_id, hour)')
+    
+    # Optional liveness checks per bot (see health.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS bot_health (
+            bot_id INTEGER PRIMARY KEY,
+            no_output_minutes INTEGER,
+            zero_cpu_minutes INTEGER,
+            heartbeat_pattern TEXT,
+            heartbeat_minutes INTEGER,
+            FOREIGN KEY(bot_id) REFERENCES bots(id)
+        )
+    ''')
+    
     # Insert default admin if not exists
     admin = c.execute("SELECT * FROM users WHERE role='ADMIN'").fetchone()
     if not admin:
+        from werkzeug.security import generate_password_hash
         admin_hash = generate_password_hash('admin123')
         c.execute('''
             INSERT INTO users (first_name, last_name, username, email_or_phone, password_hash, role)
@@ -80,10 +168,12 @@ def init_db():
         ('max_ram_mb_ultra', '1000'),
         ('global_max_running_bots', '50')
     ]
-    for key, val in default_configs:
-        c.execute('INSERT OR IGNORE INTO system_config (key, value) VALUES (?, ?)', (key, val))
+    c.executemany('INSERT OR IGNORE INTO system_config (key, value) VALUES (?, ?)', default_configs)
     
+    c.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
     conn.close()
 
-init_db()
\ No newline at end of file
+if __name__ == '__main__':
+    # Deploy step: python models.py
+    init_db()
@@ -0,0 +1,139 @@
+"""Supervisor node for cluster mode.
+
+Runs bots on behalf of a coordinator panel (app.py with
+CLUSTER_MODE=coordinator). It shares the panel's DB_PATH and UPLOAD_DIR
+and reports its headroom and bot states in a heartbeat:
+
+    CLUSTER_TOKEN=secret COORDINATOR_URL=http://127.0.0.1:5000 \\
+    NODE_ID=node-1 PORT=5101 python node.py
+
+NODE_PLANS=PRO,ULTRA restricts the node to bots of those plans.
+"""
+import json
+import os
+import signal
+import sys
+import threading
+import urllib.error
+import urllib.request
+import psutil
+from flask import Flask, request, jsonify
+import models
+import plan_manager
+import lifecycle
+from bot_manager import get_bot_manager, create_bot_manager, get_command, iter_bots
+from cluster import CLUSTER_TOKEN, TOKEN_HEADER, HEARTBEAT_INTERVAL, RPC_TIMEOUT
+
+# Plans are changed on the coordinator; always read them from the DB here
+plan_manager.CACHE_PLANS = False
+
+PORT = int(os.environ.get('PORT', 5101))
+NODE_ID = os.environ.get('NODE_ID', f'node-{PORT}')
+NODE_URL = os.environ.get('NODE_URL', f'http://127.0.0.1:{PORT}')
+COORDINATOR_URL = os.environ.get('COORDINATOR_URL', 'http://127.0.0.1:5000').rstrip('/')
+NODE_PLANS = [p for p in os.environ.get('NODE_PLANS', '').split(',') if p]
+
+app = Flask(__name__)
+_stopping = threading.Event()
+
+@app.before_request
+def _check_token():
+    if request.headers.get(TOKEN_HEADER) != CLUSTER_TOKEN:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+def _find_bot(bot_id):
+    return next((bot for bot in iter_bots() if bot.bot_id == bot_id), None)
+
+def _state(bot):
+    return dict(bot.get_state(), user_id=bot.user_id, username=bot.username, log_seq=bot.log_seq)
+
+# ------------------ Node API ------------------
+@app.route('/node/bots/<int:bot_id>/start', methods=['POST'])
+def start_bot(bot_id):
+    if _stopping.is_set():
+        return jsonify({'success': False, 'message': 'Node is shutting down', 'state': None}), 503
+    data = request.json
+    manager = get_bot_manager(data['user_id'], bot_id)
+    if not manager:
+        manager = create_bot_manager(data['user_id'], bot_id, data['username'], data['bot_name'])
+    success, msg = manager.start()
+    return jsonify({'success': success, 'message': msg, 'state': _state(manager)})
+
+@app.route('/node/bots/<int:bot_id>/stop', methods=['POST'])
+def stop_bot(bot_id):
+    data = request.json
+    manager = _find_bot(bot_id)
+    if not manager:
+        return jsonify({'error': 'Bot not found'}), 404
+    stopped = manager.stop(update_db=data.get('update_db', True), wait=data.get('wait', False),
+                           timeout=data.get('timeout'))
+    return jsonify({'stopped': stopped, 'state': _state(manager)})
+
+@app.route('/node/bots/<int:bot_id>/logs', methods=['GET'])
+def bot_logs(bot_id):
+    manager = _find_bot(bot_id)
+    if not manager:
+        return jsonify({'logs': [], 'seq': 0})
+    logs, seq = manager.get_logs_since(request.args.get('since', type=int),
+                                       request.args.get('max_lines', 500, type=int))
+    return jsonify({'logs': logs, 'seq': seq})
+
+@app.route('/node/bots/<int:bot_id>/commands', methods=['POST'])
+def bot_commands(bot_id):
+    cmds = request.json.get('commands', [])
+    manager = _find_bot(bot_id)
+    if not manager:
+        return jsonify({'error': 'Bot not found'}), 404
+    return jsonify({'commands': [c.to_dict() for c in manager.send_commands(cmds)]})
+
+@app.route('/node/commands', methods=['GET'])
+def command_status():
+    commands = [get_command(i) for i in request.args.get('ids', '').split(',')]
+    return jsonify({'commands': [c.to_dict() for c in commands if c]})
+
+# ------------------ Coordinator link ------------------
+def _post(path, body):
+    req = urllib.request.Request(COORDINATOR_URL + path, data=json.dumps(body).encode(), method='POST',
+                                 headers={'Content-Type': 'application/json', TOKEN_HEADER: CLUSTER_TOKEN})
+    with urllib.request.urlopen(req, timeout=RPC_TIMEOUT) as resp:
+        return json.loads(resp.read())
+
+def _heartbeat_loop():
+    psutil.cpu_percent(None)  # prime the counter; the first reading is meaningless
+    while not _stopping.wait(HEARTBEAT_INTERVAL):
+        memory = psutil.virtual_memory()
+        try:
+            _post('/cluster/heartbeat', {
+                'node_id': NODE_ID,
+                'url': NODE_URL,
+                'plans': NODE_PLANS,
+                'cpu_count': psutil.cpu_count() or 1,
+                'cpu_percent': psutil.cpu_percent(None),
+                'ram_total_mb': memory.total // (1024 * 1024),
+                'ram_available_mb': memory.available // (1024 * 1024),
+                'bots': [_state(bot) for bot in iter_bots()]
+            })
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            print(f'Heartbeat to {COORDINATOR_URL} failed: {e}', file=sys.stderr)
+
+def _shutdown(signum, frame):
+    """Stop local bots, then hand the running ones back to the coordinator."""
+    if _stopping.is_set():
+        return
+    _stopping.set()
+    report = lifecycle.drain(handoff=False)
+    print(f'Shutdown: {lifecycle.summary(report)}', file=sys.stderr)
+    try:
+        _post('/cluster/leave', {'node_id': NODE_ID, 'running': report['stopped'] + report['killed']})
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        print(f'Could not hand bots back to the coordinator: {e}', file=sys.stderr)
+    sys.exit(0)
+
+if __name__ == '__main__':
+    if not CLUSTER_TOKEN:
+        sys.exit('CLUSTER_TOKEN must be set')
+    models.bootstrap()
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    threading.Thread(target=_heartbeat_loop, name='node-heartbeat', daemon=True).start()
+    app.run(host='0.0.0.0', port=PORT, threaded=True)
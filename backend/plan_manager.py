@@ -1,3 +1,4 @@
+import threading
 from models import get_db
 from flask import session
 
@@ -31,13 +32,44 @@ PLANS = {
     }
 }
 
+# ------------------ Plan cache ------------------
+# Every plan change calls invalidate_plan, which drops the cached plan and
+# bumps plan_version, so polled endpoints can read the plan (and its
+# version) without touching SQLite.
+_plan_cache = {}     # user_id -> plan name
+_plan_versions = {}  # user_id -> bumped on every change
+_plan_lock = threading.Lock()
+# Cluster nodes turn this off: plan changes are made on the coordinator,
+# so a node's cache would never be invalidated
+CACHE_PLANS = True
+
+def plan_version(user_id):
+    return _plan_versions.get(user_id, 0)
+
+def invalidate_plan(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return
+    with _plan_lock:
+        _plan_cache.pop(user_id, None)
+        _plan_versions[user_id] = _plan_versions.get(user_id, 0) + 1
+
 def get_user_plan(user_id):
+    plan = _plan_cache.get(user_id) if CACHE_PLANS else None
+    if plan is not None:
+        return plan
+    version = plan_version(user_id)
     conn = get_db()
     c = conn.cursor()
     user = c.execute('SELECT plan FROM users WHERE id = ?', (user_id,)).fetchone()
     conn.close()
     if not user:
         return 'FREE'
+    with _plan_lock:
+        # Don't cache a value read before a concurrent change
+        if CACHE_PLANS and plan_version(user_id) == version:
+            _plan_cache[user_id] = user['plan']
     return user['plan']
 
 def get_plan_limits(plan_name):
@@ -66,4 +98,5 @@ def upgrade_user_plan(user_id, new_plan):
     c.execute('UPDATE users SET plan = ? WHERE id = ?', (new_plan, user_id))
     conn.commit()
     conn.close()
+    invalidate_plan(user_id)
     return True, 'Plan upgraded'
\ No newline at end of file
@@ -0,0 +1,125 @@
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+# ------------------ Slow request / query logs ------------------
+SLOW_LOG_SIZE = 200
+thresholds = {
+    'request_ms': float(os.environ.get('SLOW_REQUEST_MS', 500)),
+    'query_ms': float(os.environ.get('SLOW_QUERY_MS', 50)),
+}
+slow_requests = deque(maxlen=SLOW_LOG_SIZE)
+slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+
+_SKIP_FILES = ('models.py', 'profiling.py')
+
+def _call_site():
+    """Innermost frame outside the DB wrapper, as 'file:line in func'."""
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        if not frame.filename.endswith(_SKIP_FILES):
+            return f'{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}'
+    return None
+
+def record_request(route, method, path, status, duration):
+    duration_ms = duration * 1000
+    if duration_ms >= thresholds['request_ms']:
+        slow_requests.append({
+            'time': time.time(),
+            'route': route,
+            'method': method,
+            'path': path,
+            'status': status,
+            'duration_ms': round(duration_ms, 2)
+        })
+
+def record_query(sql, duration):
+    duration_ms = duration * 1000
+    if duration_ms >= thresholds['query_ms']:
+        # Only pay for the stack walk once we know the query was slow
+        slow_queries.append({
+            'time': time.time(),
+            'sql': ' '.join(sql.split())[:500],
+            'duration_ms': round(duration_ms, 2),
+            'call_site': _call_site(),
+            'thread': threading.current_thread().name
+        })
+
+# ------------------ Sampling profiler ------------------
+MAX_PROFILE_SECONDS = 120
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval.
+
+    Output is in collapsed-stack format ("frame;frame;frame count"),
+    which flamegraph.pl and speedscope read directly.
+    """
+    def __init__(self, seconds, interval):
+        self.seconds = seconds
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[';'.join(reversed(stack))] += 1
+            self.sample_count += 1
+            time.sleep(self.interval)
+        self.finished_at = time.time()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+    def status(self):
+        return {
+            'running': self.running,
+            'seconds': self.seconds,
+            'interval_ms': round(self.interval * 1000, 3),
+            'samples': self.sample_count,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+def start_profile(seconds, interval_ms=10):
+    """Start a profile unless one is already running; returns it or None."""
+    global _profiler
+    seconds = max(0.1, min(float(seconds), MAX_PROFILE_SECONDS))
+    interval = max(1.0, float(interval_ms)) / 1000
+    with _profiler_lock:
+        if _profiler is not None and _profiler.running:
+            return None
+        _profiler = SamplingProfiler(seconds, interval)
+        _profiler.start()
+        return _profiler
+
+def current_profile():
+    return _profiler
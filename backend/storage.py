@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from utils import UPLOAD_BASE, MAX_FILE_SIZE
+
+# Content-addressed object store shared by all users: objects/<aa>/<sha256>
+OBJECTS_DIR = os.path.join(UPLOAD_BASE, '.objects')
+TMP_DIR = os.path.join(OBJECTS_DIR, 'tmp')
+MANIFEST_NAME = '.manifest.json'
+CHUNK_SIZE = 64 * 1024
+
+_manifest_lock = threading.Lock()
+
+def object_path(digest):
+    return os.path.join(OBJECTS_DIR, digest[:2], digest)
+
+def store_stream(stream, max_size=MAX_FILE_SIZE):
+    """Copy stream into the object store while hashing it.
+
+    Returns (sha256, size), or None if the stream is larger than max_size.
+    Identical content is stored once no matter how many users upload it.
+    """
+    os.makedirs(TMP_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=TMP_DIR)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    os.remove(tmp_path)
+                    return None
+                digest.update(chunk)
+                out.write(chunk)
+        sha = digest.hexdigest()
+        path = object_path(sha)
+        if os.path.exists(path) and hash_file(path) == sha:
+            os.remove(tmp_path)
+        else:
+            # New content, or a stored object that no longer matches its
+            # name: (re)place it with what was just uploaded
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Objects are shared between users, so never let a bot edit one
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+        return sha, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_manifest(work_dir):
+    try:
+        with open(os.path.join(work_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def update_manifest(work_dir, **changes):
+    with _manifest_lock:
+        manifest = read_manifest(work_dir)
+        manifest.update(changes)
+        tmp_path = os.path.join(work_dir, f'{MANIFEST_NAME}.{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(work_dir, MANIFEST_NAME))
+        return manifest
+
+def file_digest(work_dir, filename):
+    """Hash of a working file as it is on disk now.
+
+    Bots can write to their own directory, so the manifest only records
+    what was uploaded, not what is there.
+    """
+    path = os.path.join(work_dir, filename)
+    if not os.path.exists(path):
+        return None
+    return hash_file(path)
+
+def install_object(sha, work_dir, filename):
+    """Atomically swap work_dir/filename to the stored object.
+
+    A running bot sees either the old file or the new one, never a
+    partial write. Returns False when the file already had this content.
+    """
+    if file_digest(work_dir, filename) == sha:
+        return False
+    tmp_path = os.path.join(work_dir, f'.{filename}.{uuid.uuid4().hex}.tmp')
+    # Always a private copy, never a hardlink: a bot that edits its own
+    # files must not be able to change the shared object
+    shutil.copyfile(object_path(sha), tmp_path)
+    os.replace(tmp_path, os.path.join(work_dir, filename))
+    update_manifest(work_dir, **{filename: sha})
+    return True
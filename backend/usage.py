@@ -0,0 +1,132 @@
+import threading
+import time
+from models import get_db
+
+# ------------------ Usage metering ------------------
+# The supervisor reports CPU time and RSS for every sample; they are summed
+# into hourly buckets in memory. Closed hours are written to bot_usage in
+# one executemany per flush, so sampling never touches SQLite.
+HOUR = 3600
+FLUSH_CHECK_INTERVAL = 60  # seconds between checks for closed hours
+
+_buckets = {}  # (hour, user_id, bot_id) -> [cpu_seconds, ram_mb_seconds, samples, peak_ram_mb]
+_usage_lock = threading.Lock()
+_flush_thread = None
+
+def _hour(ts):
+    return int(ts) // HOUR * HOUR
+
+def record(user_id, bot_id, cpu_seconds, ram_mb, interval):
+    """Account one sample: cpu_seconds used and ram_mb held for interval seconds."""
+    key = (_hour(time.time()), user_id, bot_id)
+    with _usage_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = [0.0, 0.0, 0, 0]
+            _ensure_flusher()
+        bucket[0] += cpu_seconds
+        bucket[1] += ram_mb * interval
+        bucket[2] += 1
+        if ram_mb > bucket[3]:
+            bucket[3] = ram_mb
+
+def _ensure_flusher():
+    global _flush_thread
+    if _flush_thread is None or not _flush_thread.is_alive():
+        _flush_thread = threading.Thread(target=_flush_loop, name='usage-flush', daemon=True)
+        _flush_thread.start()
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_CHECK_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            # Keep the buckets; the next pass retries
+            pass
+
+def flush(everything=False):
+    """Write closed hours (or everything, e.g. on shutdown) to bot_usage.
+
+    Rows are upserted, so flushing a partial hour and the rest of it later
+    adds up. Returns the number of rows written.
+    """
+    current = _hour(time.time())
+    with _usage_lock:
+        keys = [key for key in _buckets if everything or key[0] < current]
+        rows = [(hour, user_id, bot_id, *_buckets.pop((hour, user_id, bot_id)))
+                for hour, user_id, bot_id in keys]
+    if not rows:
+        return 0
+    try:
+        conn = get_db()
+        c = conn.cursor()
+        c.executemany('''
+            INSERT INTO bot_usage (hour, user_id, bot_id, cpu_seconds, ram_mb_hours, samples, peak_ram_mb)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(hour, bot_id) DO UPDATE SET
+                cpu_seconds = cpu_seconds + excluded.cpu_seconds,
+                ram_mb_hours = ram_mb_hours + excluded.ram_mb_hours,
+                samples = samples + excluded.samples,
+                peak_ram_mb = MAX(peak_ram_mb, excluded.peak_ram_mb)
+        ''', [(hour, user_id, bot_id, cpu, ram / HOUR, samples, peak)
+              for hour, user_id, bot_id, cpu, ram, samples, peak in rows])
+        conn.commit()
+        conn.close()
+    except Exception:
+        # Put the data back rather than lose it
+        with _usage_lock:
+            for hour, user_id, bot_id, cpu, ram, samples, peak in rows:
+                bucket = _buckets.setdefault((hour, user_id, bot_id), [0.0, 0.0, 0, 0])
+                bucket[0] += cpu
+                bucket[1] += ram
+                bucket[2] += samples
+                bucket[3] = max(bucket[3], peak)
+        raise
+    return len(rows)
+
+# ------------------ Reports ------------------
+def _empty():
+    return {'cpu_seconds': 0.0, 'ram_mb_hours': 0.0, 'samples': 0, 'peak_ram_mb': 0}
+
+def _add(total, cpu, ram_mb_hours, samples, peak):
+    total['cpu_seconds'] += cpu
+    total['ram_mb_hours'] += ram_mb_hours
+    total['samples'] += samples
+    total['peak_ram_mb'] = max(total['peak_ram_mb'], peak or 0)
+
+def _rounded(total):
+    total['cpu_seconds'] = round(total['cpu_seconds'], 2)
+    total['ram_mb_hours'] = round(total['ram_mb_hours'], 3)
+    return total
+
+def totals(since, group_by='bot_id', user_id=None):
+    """Usage since a timestamp, summed per bot_id, user_id or hour.
+
+    Merges flushed rows with the unflushed in-memory buckets.
+    """
+    column = {'bot_id': 'bot_id', 'user_id': 'user_id', 'hour': 'hour'}[group_by]
+    index = {'hour': 0, 'user_id': 1, 'bot_id': 2}[group_by]
+    since = _hour(since)
+    where, params = 'hour >= ?', [since]
+    if user_id is not None:
+        where += ' AND user_id = ?'
+        params.append(user_id)
+    conn = get_db()
+    c = conn.cursor()
+    rows = c.execute(f'''
+        SELECT {column} AS k, SUM(cpu_seconds) AS cpu, SUM(ram_mb_hours) AS ram,
+               SUM(samples) AS samples, MAX(peak_ram_mb) AS peak
+        FROM bot_usage WHERE {where} GROUP BY {column}
+    ''', params).fetchall()
+    conn.close()
+    result = {}
+    for row in rows:
+        _add(result.setdefault(row['k'], _empty()), row['cpu'], row['ram'], row['samples'], row['peak'])
+    with _usage_lock:
+        pending = [(key, list(bucket)) for key, bucket in _buckets.items()]
+    for key, (cpu, ram, samples, peak) in pending:
+        if key[0] < since or (user_id is not None and key[1] != user_id):
+            continue
+        _add(result.setdefault(key[index], _empty()), cpu, ram / HOUR, samples, peak)
+    return {k: _rounded(v) for k, v in result.items()}
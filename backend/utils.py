@@ -1,9 +1,9 @@
+import hashlib
 import os
-import re
 from werkzeug.utils import secure_filename
 from flask import session
 
-UPLOAD_BASE = os.path.join(os.path.dirname(__file__), 'uploads')
+UPLOAD_BASE = os.environ.get('UPLOAD_DIR', os.path.join(os.path.dirname(__file__), 'uploads'))
 ALLOWED_FILES = {'requirements.txt', 'bot.py'}
 MAX_FILE_SIZE = 1 * 1024 * 1024  # 1MB
 
@@ -42,13 +42,6 @@ def is_safe_path(basedir, path):
     real_path = os.path.realpath(path)
     return os.path.commonpath([real_basedir, real_path]) == real_basedir
 
-def detect_infinite_loop(code):
-    """Very basic suspicious pattern detection."""
-    patterns = [
-        r'while\s+True\s*:\s*(?!.*(break|return|exit))',
-        r'for\s+.*\s+in\s+range\(\d{6,}\)',
-    ]
-    for pattern in patterns:
-        if re.search(pattern, code, re.IGNORECASE):
-            return True
-    return False
\ No newline at end of file
+def fingerprint(value):
+    """Short digest of repr(value); unlike hash() it is the same in every process."""
+    return hashlib.blake2b(repr(value).encode(), digest_size=8).hexdigest()
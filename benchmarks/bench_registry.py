@@ -0,0 +1,55 @@
+"""Memory footprint of the in-process bot registry.
+
+Registers --bots idle BotProcess records (no processes are spawned) and
+reports the bytes retained per registered bot, as measured by tracemalloc:
+
+    python benchmarks/bench_registry.py --bots 100000 --output registry.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bots', type=int, default=100000)
+    parser.add_argument('--bots-per-user', type=int, default=3)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='panel-registry-')
+    os.environ['DB_PATH'] = os.path.join(workdir, 'app.db')
+    os.environ['UPLOAD_DIR'] = os.path.join(workdir, 'uploads')
+    sys.path.insert(0, BACKEND)
+    import bot_manager
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    for i in range(args.bots):
+        user_id = i // args.bots_per_user + 1
+        bot_manager.create_bot_manager(user_id, i + 1, f'user{user_id}', f'bot{i + 1}')
+    elapsed = time.perf_counter() - start
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'bots': args.bots,
+        'bytes_total': after - before,
+        'bytes_per_bot': round((after - before) / args.bots, 1),
+        'peak_bytes': peak - before,
+        'register_us_per_bot': round(elapsed / args.bots * 1e6, 2)
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == '__main__':
+    main()
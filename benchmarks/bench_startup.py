@@ -0,0 +1,64 @@
+"""Worker startup time.
+
+Imports the panel in --runs fresh interpreters and reports the median
+time until the module is ready, for a new database (first boot) and for
+a database that is already bootstrapped (rolling restart):
+
+    python benchmarks/bench_startup.py --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+
+# Runs inside the child: time the import only, not interpreter startup
+PROBE = 'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'
+
+def measure(module, env, fresh_db=None):
+    if fresh_db and os.path.exists(fresh_db):
+        os.remove(fresh_db)
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', PROBE.format(module=module)],
+                                     cwd=BACKEND, env=env, text=True)
+    wall = time.perf_counter() - start
+    return float(output.strip().splitlines()[-1]), wall
+
+def summarize(samples):
+    imports, walls = zip(*samples)
+    return {
+        'import_ms': round(statistics.median(imports) * 1000, 1),
+        'process_ms': round(statistics.median(walls) * 1000, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='panel-startup-')
+    db_path = os.path.join(workdir, 'app.db')
+    env = dict(os.environ, DB_PATH=db_path, UPLOAD_DIR=os.path.join(workdir, 'uploads'),
+               PYTHONPATH=BACKEND, PYTHONDONTWRITEBYTECODE='')
+
+    measure('app', env)  # warm the bytecode cache
+    result = {
+        'runs': args.runs,
+        'app_first_boot': summarize([measure('app', env, fresh_db=db_path) for _ in range(args.runs)]),
+        'app_restart': summarize([measure('app', env) for _ in range(args.runs)]),
+        'models_only': summarize([measure('models', env) for _ in range(args.runs)])
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == '__main__':
+    main()
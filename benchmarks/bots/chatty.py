@@ -0,0 +1,10 @@
+# Synthetic bot: steady stream of log lines, like a busy bot with debug logging
+import time
+
+print('BENCH-READY', flush=True)
+n = 0
+while True:
+    for _ in range(10):
+        n += 1
+        print(f'update {n}: handled message from chat {n % 97}', flush=True)
+    time.sleep(0.2)
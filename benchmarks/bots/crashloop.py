@@ -0,0 +1,9 @@
+# Synthetic bot: crashes shortly after every start to exercise the restart path
+import sys
+import time
+
+print('BENCH-READY', flush=True)
+time.sleep(1)
+print('Traceback (most recent call last):', flush=True)
+print('RuntimeError: synthetic crash', flush=True)
+sys.exit(1)
@@ -0,0 +1,6 @@
+# Synthetic bot: starts, says hello and waits, like a bot with no traffic
+import time
+
+print('BENCH-READY', flush=True)
+while True:
+    time.sleep(1)
@@ -0,0 +1,7 @@
+# Synthetic bot: holds ~64MB of memory, well under the ULTRA RAM limit
+import time
+
+ballast = [bytearray(b'x' * (1024 * 1024)) for _ in range(64)]
+print('BENCH-READY', flush=True)
+while True:
+    time.sleep(1)
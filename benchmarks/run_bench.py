@@ -0,0 +1,360 @@
+"""End-to-end load benchmark for the panel.
+
+Starts backend/app.py against a throwaway database and upload directory,
+creates --users users with --bots bots each, uploads the synthetic bots in
+benchmarks/bots/ (no Telegram access needed) and then polls the REST API
+the way the dashboard does. Results are written as JSON so runs from
+different commits can be compared:
+
+    python benchmarks/run_bench.py --users 4 --bots 3 --duration 30 --output new.json
+    python benchmarks/run_bench.py compare old.json new.json
+
+Bots share their owner's upload directory, so every bot of a user runs the
+same synthetic kind; kinds are assigned to users round-robin.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, 'backend')
+BOTS_DIR = os.path.join(ROOT, 'benchmarks', 'bots')
+KINDS = ('chatty', 'idle', 'crashloop', 'memhog')
+READY_MARKER = 'BENCH-READY'
+
+# ------------------ HTTP client ------------------
+class Client:
+    def __init__(self, base_url, latencies):
+        self.base_url = base_url
+        self.latencies = latencies
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def _send(self, req, name):
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                status, payload, headers = resp.status, resp.read(), resp.headers
+        except urllib.error.HTTPError as e:
+            # urllib raises for 304 too
+            status, payload, headers = e.code, e.read(), e.headers
+        elapsed = time.perf_counter() - start
+        if name:
+            self.latencies.setdefault(name, []).append(elapsed)
+        return status, payload, headers
+
+    def request(self, method, path, body=None, content_type=None, name=None):
+        headers = {}
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+            content_type = 'application/json'
+        if content_type:
+            headers['Content-Type'] = content_type
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        status, payload, _ = self._send(req, name)
+        return status, payload
+
+    def conditional(self, path, etag, name=None):
+        """GET with If-None-Match; returns (status, data, etag), data is None on 304."""
+        headers = {'If-None-Match': etag} if etag else {}
+        req = urllib.request.Request(self.base_url + path, headers=headers)
+        status, payload, headers = self._send(req, name)
+        if status != 200:
+            return status, None, etag
+        return status, json.loads(payload), headers.get('ETag', etag)
+
+    def json(self, method, path, body=None, name=None):
+        status, payload = self.request(method, path, body, name=name)
+        try:
+            return status, json.loads(payload)
+        except ValueError:
+            return status, None
+
+    def upload(self, bot_id, filename, content):
+        boundary = uuid.uuid4().hex
+        parts = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="bot_id"\r\n\r\n{bot_id}\r\n'.encode(),
+            f'--{boundary}\r\nContent-Disposition: form-data; name="bot"; filename="{filename}"\r\n'
+            f'Content-Type: text/x-python\r\n\r\n'.encode() + content + b'\r\n',
+            f'--{boundary}--\r\n'.encode()
+        ]
+        return self.request('POST', '/upload', b''.join(parts),
+                            content_type=f'multipart/form-data; boundary={boundary}', name='upload')
+
+# ------------------ Server ------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(workdir, port):
+    env = dict(os.environ,
+               PORT=str(port),
+               DB_PATH=os.path.join(workdir, 'bench.db'),
+               UPLOAD_DIR=os.path.join(workdir, 'uploads'),
+               SECRET_KEY='bench')
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    server = subprocess.Popen([sys.executable, 'app.py'], cwd=BACKEND, env=env,
+                              stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'server exited early, see {log.name}')
+        try:
+            urllib.request.urlopen(base_url + '/app/version', timeout=1).read()
+            return server, base_url
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('server did not come up within 30s')
+
+def stop_server(server):
+    # Bots run in their own sessions, so collect them before the panel goes
+    try:
+        children = psutil.Process(server.pid).children(recursive=True)
+    except psutil.NoSuchProcess:
+        children = []
+    server.terminate()
+    try:
+        server.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+    for child in children:
+        try:
+            child.kill()
+        except psutil.NoSuchProcess:
+            pass
+
+def panel_stats(server):
+    p = psutil.Process(server.pid)
+    return {'rss_mb': p.memory_info().rss / (1024 * 1024), 'threads': p.num_threads()}
+
+def log_lines_total(client):
+    status, payload = client.request('GET', '/metrics')
+    if status != 200:
+        return None
+    text = payload.decode()
+    return sum(float(v) for v in re.findall(r'^panel_bot_log_lines_total\{[^}]*\} (\S+)$', text, re.M))
+
+# ------------------ Phases ------------------
+def setup_users(base_url, users, bots_per_user, latencies):
+    clients = []
+    for u in range(users):
+        client = Client(base_url, latencies)
+        username = f'bench{u}'
+        client.json('POST', '/signup', {
+            'first_name': 'Bench', 'last_name': str(u), 'username': username,
+            'email_or_phone': f'{username}@example.com', 'password': 'bench-password'
+        }, name='signup')
+        client.json('POST', '/login', {'username': username, 'password': 'bench-password'}, name='login')
+        # ULTRA allows 10 bots; the harness needs more than FREE's single bot
+        client.json('POST', '/upgrade-plan', {'plan': 'ULTRA'})
+        kind = KINDS[u % len(KINDS)]
+        bot_ids = []
+        for b in range(bots_per_user):
+            status, data = client.json('POST', '/bot/create', {'bot_name': f'{kind}-{b}'}, name='create')
+            if status != 200 or not data.get('success'):
+                raise RuntimeError(f'could not create bot for {username}: {data}')
+            bot_ids.append(data['bot_id'])
+        with open(os.path.join(BOTS_DIR, f'{kind}.py'), 'rb') as f:
+            client.upload(bot_ids[0], 'bot.py', f.read())
+        clients.append({'client': client, 'kind': kind, 'bot_ids': bot_ids})
+    return clients
+
+def start_bots(clients, ready_timeout):
+    started = {}
+    for entry in clients:
+        client = entry['client']
+        for bot_id in entry['bot_ids']:
+            while True:
+                status, data = client.json('POST', '/bot/start', {'bot_id': bot_id}, name='start')
+                if status != 429:
+                    break
+                time.sleep(1)  # /bot/start is rate limited per user
+            if data and data.get('success'):
+                started[(id(client), bot_id)] = (entry, time.perf_counter())
+
+    # Start-to-first-log: time until the bot's own READY line shows up
+    first_log = {}
+    deadline = time.time() + ready_timeout
+    while started.keys() - first_log.keys() and time.time() < deadline:
+        for key, (entry, t0) in started.items():
+            if key in first_log:
+                continue
+            status, data = entry['client'].json('GET', f'/bot/logs?bot_id={key[1]}')
+            if data and any(READY_MARKER in line[1] for line in data.get('logs', [])):
+                first_log[key] = time.perf_counter() - t0
+        time.sleep(0.05)
+    by_kind = {}
+    for key, seconds in first_log.items():
+        by_kind.setdefault(started[key][0]['kind'], []).append(seconds)
+    return len(started), list(first_log.values()), by_kind
+
+def dashboard_load(clients, duration, scale, stop_event):
+    """One thread per user replaying the dashboard's polling loop: a
+    conditional /dashboard/state request every 2 seconds that carries the
+    selected bot's log_since, like frontend/script.js."""
+    def run(entry):
+        client = entry['client']
+        bot_id = entry['bot_ids'][0]
+        etag, log_seq = None, None
+        while not stop_event.is_set():
+            path = f'/dashboard/state?logs={bot_id}'
+            if log_seq is not None:
+                path += f'&log_since={log_seq}'
+            status, data, etag = client.conditional(path, etag, name='dashboard_state')
+            if data is not None:
+                log_seq = data['log_seq'].get(str(bot_id), log_seq)
+            stop_event.wait(2 * scale)
+
+    threads = [threading.Thread(target=run, args=(entry,), daemon=True) for entry in clients]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop_event.set()
+    for t in threads:
+        t.join(timeout=30)
+
+# ------------------ Reporting ------------------
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[index]
+
+def summarize(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p90_ms': round(percentile(values, 90) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'max_ms': round(max(values) * 1000, 3)
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    latencies = {}
+    with tempfile.TemporaryDirectory(prefix='panel-bench-') as workdir:
+        server, base_url = start_server(workdir, args.port or free_port())
+        try:
+            clients = setup_users(base_url, args.users, args.bots, latencies)
+            idle_panel = panel_stats(server)
+            started, first_log, first_log_by_kind = start_bots(clients, args.ready_timeout)
+            loaded_panel = panel_stats(server)
+
+            # Setup traffic is not what we want to measure
+            poll_latencies = {}
+            for entry in clients:
+                entry['client'].latencies = poll_latencies
+            probe = clients[0]['client'] if clients else Client(base_url, {})
+            lines_before = log_lines_total(probe)
+            t0 = time.perf_counter()
+            dashboard_load(clients, args.duration, args.poll_scale, threading.Event())
+            elapsed = time.perf_counter() - t0
+            lines_after = log_lines_total(probe)
+            final_panel = panel_stats(server)
+        finally:
+            stop_server(server)
+
+    per_bot = max(started, 1)
+    all_polls = [v for values in poll_latencies.values() for v in values]
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'config': {
+            'users': args.users, 'bots_per_user': args.bots,
+            'duration_s': args.duration, 'poll_scale': args.poll_scale
+        },
+        'bots_started': started,
+        'api': {'all': summarize(all_polls), **{k: summarize(v) for k, v in sorted(poll_latencies.items())}},
+        'setup_api': {k: summarize(v) for k, v in sorted(latencies.items())},
+        'log_ingestion_lines_per_s': (
+            round((lines_after - lines_before) / elapsed, 1)
+            if lines_before is not None and lines_after is not None else None),
+        'start_to_first_log': {
+            'all': summarize(first_log),
+            **{kind: summarize(v) for kind, v in sorted(first_log_by_kind.items())}
+        },
+        'panel': {
+            'idle': idle_panel,
+            'loaded': final_panel,
+            'rss_mb_per_bot': round((loaded_panel['rss_mb'] - idle_panel['rss_mb']) / per_bot, 3),
+            'threads_per_bot': round((loaded_panel['threads'] - idle_panel['threads']) / per_bot, 3)
+        }
+    }
+
+def flatten(data, prefix=''):
+    out = {}
+    for key, value in data.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            out.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[path] = value
+    return out
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f'{"metric":<48} {old.get("commit") or "old":>12} {new.get("commit") or "new":>12} {"change":>9}')
+    old_flat, new_flat = flatten(old), flatten(new)
+    for key in sorted(old_flat.keys() & new_flat.keys()):
+        a, b = old_flat[key], new_flat[key]
+        change = f'{(b - a) / a * 100:+.1f}%' if a else ''
+        print(f'{key:<48} {a:>12} {b:>12} {change:>9}')
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        parser = argparse.ArgumentParser(prog='run_bench.py compare')
+        parser.add_argument('old')
+        parser.add_argument('new')
+        args = parser.parse_args(sys.argv[2:])
+        compare(args.old, args.new)
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--bots', type=int, default=2, help='bots per user (ULTRA allows 10)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of dashboard polling')
+    parser.add_argument('--poll-scale', type=float, default=1.0,
+                        help='multiplier for the dashboard poll intervals (0.1 = 10x more traffic)')
+    parser.add_argument('--ready-timeout', type=float, default=60)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--output', help='write results JSON here (default: stdout)')
+    args = parser.parse_args()
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+if __name__ == '__main__':
+    main()
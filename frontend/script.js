@@ -1,9 +1,7 @@
 // Global state
 let currentBotId = null;
 let timerInterval = null;
-let logsPollInterval = null;
 let statusPollInterval = null;
-let resourcesPollInterval = null;
 let timerSeconds = 0;
 let botStartTime = null;
 
@@ -21,9 +19,11 @@ const API = {
     startBot: '/bot/start',
     stopBot: '/bot/stop',
     restartBot: '/bot/restart',
+    operation: '/bot/operation',
     logs: '/bot/logs',
     status: '/bot/status',
     resources: '/bot/resources',
+    dashboardState: '/dashboard/state',
     command: '/bot/command',
     downloadLogs: '/bot/logs/download',
     
@@ -47,6 +47,25 @@ function showToast(message, type = 'success') {
     }, 5000);
 }
 
+// Conditional GET for polled endpoints: resend the last ETag and reuse the
+// cached body on 304. `changed` is false when nothing needs re-rendering.
+const etagCache = new Map();
+
+async function fetchJSONCached(url, key = url) {
+    const cached = etagCache.get(key);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const res = await fetch(url, { headers, cache: 'no-store' });
+    if (res.status === 304 && cached) {
+        return { data: cached.data, changed: false };
+    }
+    const data = await res.json();
+    const etag = res.headers.get('ETag');
+    if (etag) {
+        etagCache.set(key, { etag, data });
+    }
+    return { data, changed: true };
+}
+
 // Loading spinner
 function showLoading(button) {
     const originalText = button.textContent;
@@ -152,13 +171,136 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+// ------------------ Console ------------------
+// Virtualized log view: the full buffer lives in memory and only the rows
+// in (or near) the viewport are in the DOM. New lines are appended without
+// re-rendering the rest, and the view follows the tail only while the
+// user is already at the bottom.
+const CONSOLE_ROW_HEIGHT = 20; // px, must match .console-line in style.css
+const CONSOLE_OVERSCAN = 20;   // extra rows rendered above and below
+
+class LogConsole {
+    constructor(el) {
+        this.el = el;
+        this.maxLines = 500;
+        this.filter = '';
+        this.frame = null;
+        this.el.innerHTML = '';
+        this.spacer = document.createElement('div');
+        this.spacer.className = 'console-spacer';
+        this.rowsEl = document.createElement('div');
+        this.rowsEl.className = 'console-rows';
+        this.spacer.appendChild(this.rowsEl);
+        this.el.appendChild(this.spacer);
+        this.el.addEventListener('scroll', () => this.scheduleRender());
+        this.reset();
+    }
+
+    reset() {
+        this.lines = [];    // [timestamp, line, isError] entries, oldest first
+        this.view = null;   // lines matching the filter, or null when unfiltered
+        this.seq = null;    // server sequence number of the last line
+        this.el.scrollTop = 0;
+        this.render();
+    }
+
+    rows() {
+        return this.view || this.lines;
+    }
+
+    matches(entry) {
+        return entry[1].toLowerCase().includes(this.filter);
+    }
+
+    isAtBottom() {
+        return this.el.scrollTop + this.el.clientHeight >= this.el.scrollHeight - CONSOLE_ROW_HEIGHT;
+    }
+
+    append(lines, seq) {
+        if (this.seq !== null && seq < this.seq) {
+            // The server's counter went backwards: start over
+            this.lines = [];
+            this.view = this.filter ? [] : null;
+        } else if (this.seq !== null) {
+            // Only the last seq - this.seq lines are new; the rest were
+            // already appended by an overlapping response
+            lines = lines.slice(Math.max(0, lines.length - (seq - this.seq)));
+        }
+        this.seq = seq;
+        if (lines.length === 0) return;
+        
+        const stick = this.isAtBottom();
+        this.lines = this.lines.concat(lines);
+        let droppedRows = 0;
+        const overflow = this.lines.length - this.maxLines;
+        if (overflow > 0) {
+            const dropped = new Set(this.lines.slice(0, overflow));
+            this.lines = this.lines.slice(overflow);
+            if (this.view) {
+                while (droppedRows < this.view.length && dropped.has(this.view[droppedRows])) {
+                    droppedRows++;
+                }
+                this.view = this.view.slice(droppedRows);
+            } else {
+                droppedRows = overflow;
+            }
+        }
+        if (this.view) {
+            // New lines that survived trimming are at the end of the buffer
+            lines.slice(Math.max(0, lines.length - this.lines.length)).forEach(entry => {
+                if (this.matches(entry)) this.view.push(entry);
+            });
+        }
+        
+        this.spacer.style.height = `${this.rows().length * CONSOLE_ROW_HEIGHT}px`;
+        if (stick) {
+            this.el.scrollTop = this.el.scrollHeight;
+        } else if (droppedRows > 0) {
+            // Keep the rows the user is reading in place
+            this.el.scrollTop = Math.max(0, this.el.scrollTop - droppedRows * CONSOLE_ROW_HEIGHT);
+        }
+        this.render();
+    }
+
+    setFilter(text) {
+        this.filter = text.trim().toLowerCase();
+        this.view = this.filter ? this.lines.filter(entry => this.matches(entry)) : null;
+        this.spacer.style.height = `${this.rows().length * CONSOLE_ROW_HEIGHT}px`;
+        this.el.scrollTop = this.el.scrollHeight;
+        this.render();
+    }
+
+    scheduleRender() {
+        if (this.frame !== null) return;
+        this.frame = requestAnimationFrame(() => {
+            this.frame = null;
+            this.render();
+        });
+    }
+
+    render() {
+        const rows = this.rows();
+        this.spacer.style.height = `${rows.length * CONSOLE_ROW_HEIGHT}px`;
+        const top = this.el.scrollTop;
+        const first = Math.max(0, Math.floor(top / CONSOLE_ROW_HEIGHT) - CONSOLE_OVERSCAN);
+        const last = Math.min(rows.length, Math.ceil((top + this.el.clientHeight) / CONSOLE_ROW_HEIGHT) + CONSOLE_OVERSCAN);
+        this.rowsEl.style.transform = `translateY(${first * CONSOLE_ROW_HEIGHT}px)`;
+        // Lines arrive HTML-escaped from the server
+        this.rowsEl.innerHTML = rows.slice(first, last).map(([timestamp, line, isError]) =>
+            `<div class="console-line ${isError ? 'console-error' : ''}">[${timestamp}] ${line}</div>`
+        ).join('');
+    }
+}
+
+let logConsole = null;
+
 // ------------------ Dashboard ------------------
 async function initDashboard() {
-    // Load user plan
-    await loadPlanInfo();
+    const consoleEl = document.getElementById('console');
+    if (consoleEl) logConsole = new LogConsole(consoleEl);
     
-    // Load bots list
-    await loadBots();
+    // Plan, bot list and the selected bot's details arrive in one request
+    await refreshDashboard();
     
     // Setup event listeners
     setupDashboardEvents();
@@ -167,157 +309,156 @@ async function initDashboard() {
     startPolling();
 }
 
-async function loadPlanInfo() {
-    try {
-        const res = await fetch(API.planInfo);
-        const data = await res.json();
-        const planBadge = document.getElementById('plan-badge');
-        if (planBadge) {
-            planBadge.textContent = data.plan;
+function dashboardStateUrl() {
+    if (!currentBotId) return API.dashboardState;
+    let url = `${API.dashboardState}?logs=${currentBotId}`;
+    // Only ask for lines the console doesn't have yet
+    if (logConsole && logConsole.seq !== null) url += `&log_since=${logConsole.seq}`;
+    return url;
+}
+
+let refreshPending = null;   // in-flight dashboard request
+let refreshQueued = null;    // one more refresh to run after it
+
+function refreshDashboard() {
+    // One request at a time: callers that arrive meanwhile (the poll timer,
+    // button handlers) share a single follow-up instead of racing it
+    if (refreshPending) {
+        if (!refreshQueued) {
+            refreshQueued = refreshPending.then(() => {
+                refreshQueued = null;
+                return refreshDashboard();
+            });
         }
-    } catch (err) {
-        console.error('Failed to load plan info', err);
+        return refreshQueued;
     }
+    refreshPending = loadDashboard().finally(() => {
+        refreshPending = null;
+    });
+    return refreshPending;
 }
 
-async function loadBots() {
+async function loadDashboard() {
     try {
-        const res = await fetch(API.listBots);
-        const bots = await res.json();
-        const select = document.getElementById('bot-select');
-        if (!select) return;
-        
-        select.innerHTML = '<option value="">-- Select a bot --</option>';
-        bots.forEach(bot => {
-            const option = document.createElement('option');
-            option.value = bot.id;
-            option.textContent = `${bot.bot_name} (${bot.status})`;
-            select.appendChild(option);
-        });
-        
-        // If there's a bot, select the first one
-        if (bots.length > 0) {
-            select.value = bots[0].id;
-            currentBotId = bots[0].id;
-            loadBotDetails(currentBotId);
-        } else {
-            // Show create bot form
-            document.getElementById('no-bot-message').style.display = 'block';
-            document.getElementById('bot-controls').style.display = 'none';
-        }
-        
-        select.addEventListener('change', (e) => {
-            currentBotId = e.target.value;
-            if (currentBotId) {
-                loadBotDetails(currentBotId);
+        // Keyed by 'dashboard', not URL: log_since changes on every new line
+        const requestedBotId = currentBotId;
+        const { data, changed } = await fetchJSONCached(dashboardStateUrl(), 'dashboard');
+        if (!changed || currentBotId !== requestedBotId) return;
+        renderPlanInfo(data);
+        renderBots(data.bots);
+        const bot = data.bots.find(b => String(b.id) === String(currentBotId));
+        if (bot) {
+            renderBotStatus(bot);
+            renderResources(bot);
+            if (logConsole && bot.id in data.log_seq) {
+                logConsole.maxLines = data.limits.max_log_lines;
+                logConsole.append(data.logs[bot.id], data.log_seq[bot.id]);
             }
-        });
+        }
     } catch (err) {
-        console.error('Failed to load bots', err);
+        console.error('Failed to refresh dashboard', err);
     }
 }
 
-async function loadBotDetails(botId) {
-    if (!botId) return;
-    
-    // Update UI to show controls
-    document.getElementById('no-bot-message').style.display = 'none';
-    document.getElementById('bot-controls').style.display = 'block';
-    
-    // Load bot status
-    await updateBotStatus(botId);
+function renderPlanInfo(data) {
+    const planBadge = document.getElementById('plan-badge');
+    if (planBadge) {
+        planBadge.textContent = data.plan;
+    }
+}
+
+function renderBots(bots) {
+    const select = document.getElementById('bot-select');
+    if (!select) return;
     
-    // Load logs
-    await updateLogs(botId);
+    select.innerHTML = '<option value="">-- Select a bot --</option>';
+    bots.forEach(bot => {
+        const option = document.createElement('option');
+        option.value = bot.id;
+        option.textContent = `${bot.bot_name} (${bot.status})`;
+        select.appendChild(option);
+    });
     
-    // Load resources
-    await updateResources(botId);
+    // Keep the current selection; otherwise select the first bot
+    if (!bots.some(b => String(b.id) === String(currentBotId))) {
+        currentBotId = bots.length > 0 ? bots[0].id : null;
+        if (logConsole) logConsole.reset();
+    }
+    if (currentBotId) {
+        select.value = currentBotId;
+        document.getElementById('no-bot-message').style.display = 'none';
+        document.getElementById('bot-controls').style.display = 'block';
+    } else {
+        // Show create bot form
+        document.getElementById('no-bot-message').style.display = 'block';
+        document.getElementById('bot-controls').style.display = 'none';
+    }
 }
 
-async function updateBotStatus(botId) {
-    try {
-        const res = await fetch(`${API.status}?bot_id=${botId}`);
-        const data = await res.json();
-        const statusEl = document.getElementById('bot-status');
-        if (statusEl) {
-            statusEl.textContent = data.status;
-            statusEl.className = `status-badge status-${data.status.toLowerCase()}`;
-        }
-        
-        // Update timer
-        if (data.start_time) {
-            botStartTime = new Date(data.start_time);
-            startTimer();
-        } else {
-            stopTimer();
-        }
-        
-        // Update buttons state
-        const startBtn = document.getElementById('start-btn');
-        const stopBtn = document.getElementById('stop-btn');
-        const restartBtn = document.getElementById('restart-btn');
-        const commandInput = document.getElementById('command-input');
-        const sendCommandBtn = document.getElementById('send-command-btn');
-        
-        if (data.status === 'RUNNING') {
-            startBtn.disabled = true;
-            stopBtn.disabled = false;
-            restartBtn.disabled = false;
-            if (commandInput) commandInput.disabled = false;
-            if (sendCommandBtn) sendCommandBtn.disabled = false;
-        } else {
-            startBtn.disabled = false;
-            stopBtn.disabled = true;
-            restartBtn.disabled = true;
-            if (commandInput) commandInput.disabled = true;
-            if (sendCommandBtn) sendCommandBtn.disabled = true;
-        }
-    } catch (err) {
-        console.error('Failed to update status', err);
-    }
+async function selectBot(botId) {
+    currentBotId = botId || null;
+    // The panels may be showing another bot: force a full render
+    etagCache.delete('dashboard');
+    if (logConsole) logConsole.reset();
+    await refreshDashboard();
 }
 
-async function updateLogs(botId) {
-    try {
-        const res = await fetch(`${API.logs}?bot_id=${botId}`);
-        const data = await res.json();
-        const consoleEl = document.getElementById('console');
-        if (consoleEl && data.logs) {
-            consoleEl.innerHTML = data.logs.map(log => {
-                const [timestamp, line, isError] = log;
-                return `<div class="console-line ${isError ? 'console-error' : ''}">[${timestamp}] ${line}</div>`;
-            }).join('');
-            // Auto-scroll to bottom
-            consoleEl.scrollTop = consoleEl.scrollHeight;
-        }
-    } catch (err) {
-        console.error('Failed to update logs', err);
+function renderBotStatus(data) {
+    const statusEl = document.getElementById('bot-status');
+    if (statusEl) {
+        statusEl.textContent = data.status;
+        statusEl.className = `status-badge status-${data.status.toLowerCase()}`;
+    }
+    
+    // Update timer
+    const startTime = data.start_time ? new Date(data.start_time) : null;
+    if (!startTime) {
+        botStartTime = null;
+        stopTimer();
+    } else if (!botStartTime || startTime.getTime() !== botStartTime.getTime()) {
+        botStartTime = startTime;
+        startTimer();
+    }
+    
+    // Update buttons state
+    const startBtn = document.getElementById('start-btn');
+    const stopBtn = document.getElementById('stop-btn');
+    const restartBtn = document.getElementById('restart-btn');
+    const commandInput = document.getElementById('command-input');
+    const sendCommandBtn = document.getElementById('send-command-btn');
+    
+    if (data.status === 'RUNNING') {
+        startBtn.disabled = true;
+        stopBtn.disabled = false;
+        restartBtn.disabled = false;
+        if (commandInput) commandInput.disabled = false;
+        if (sendCommandBtn) sendCommandBtn.disabled = false;
+    } else {
+        startBtn.disabled = false;
+        stopBtn.disabled = true;
+        restartBtn.disabled = true;
+        if (commandInput) commandInput.disabled = true;
+        if (sendCommandBtn) sendCommandBtn.disabled = true;
     }
 }
 
-async function updateResources(botId) {
-    try {
-        const res = await fetch(`${API.resources}?bot_id=${botId}`);
-        const data = await res.json();
-        const cpuBar = document.getElementById('cpu-bar');
-        const ramBar = document.getElementById('ram-bar');
-        const cpuText = document.getElementById('cpu-text');
-        const ramText = document.getElementById('ram-text');
-        
-        if (cpuBar) {
-            cpuBar.style.width = `${data.cpu}%`;
-            cpuBar.className = `resource-fill ${data.cpu > 80 ? 'resource-fill-danger' : data.cpu > 50 ? 'resource-fill-warning' : ''}`;
-        }
-        if (cpuText) cpuText.textContent = `${data.cpu}%`;
-        if (ramBar) {
-            const ramPercent = Math.min((data.ram / 500) * 100, 100); // Assume 500MB max for display
-            ramBar.style.width = `${ramPercent}%`;
-            ramBar.className = `resource-fill ${ramPercent > 80 ? 'resource-fill-danger' : ramPercent > 50 ? 'resource-fill-warning' : ''}`;
-        }
-        if (ramText) ramText.textContent = `${data.ram} MB`;
-    } catch (err) {
-        console.error('Failed to update resources', err);
+function renderResources(data) {
+    const cpuBar = document.getElementById('cpu-bar');
+    const ramBar = document.getElementById('ram-bar');
+    const cpuText = document.getElementById('cpu-text');
+    const ramText = document.getElementById('ram-text');
+    
+    if (cpuBar) {
+        cpuBar.style.width = `${data.cpu}%`;
+        cpuBar.className = `resource-fill ${data.cpu > 80 ? 'resource-fill-danger' : data.cpu > 50 ? 'resource-fill-warning' : ''}`;
+    }
+    if (cpuText) cpuText.textContent = `${data.cpu}%`;
+    if (ramBar) {
+        const ramPercent = Math.min((data.ram / 500) * 100, 100); // Assume 500MB max for display
+        ramBar.style.width = `${ramPercent}%`;
+        ramBar.className = `resource-fill ${ramPercent > 80 ? 'resource-fill-danger' : ramPercent > 50 ? 'resource-fill-warning' : ''}`;
     }
+    if (ramText) ramText.textContent = `${data.ram} MB`;
 }
 
 function startTimer() {
@@ -356,6 +497,18 @@ function stopTimer() {
 }
 
 function setupDashboardEvents() {
+    // Filter the console
+    const consoleFilter = document.getElementById('console-filter');
+    if (consoleFilter && logConsole) {
+        consoleFilter.addEventListener('input', (e) => logConsole.setFilter(e.target.value));
+    }
+    
+    // Switch bots
+    const botSelect = document.getElementById('bot-select');
+    if (botSelect) {
+        botSelect.addEventListener('change', (e) => selectBot(e.target.value));
+    }
+    
     // Create new bot
     const createBotBtn = document.getElementById('create-bot-btn');
     if (createBotBtn) {
@@ -371,7 +524,7 @@ function setupDashboardEvents() {
                 const data = await res.json();
                 if (data.success) {
                     showToast('Bot created!');
-                    await loadBots();
+                    await refreshDashboard();
                 } else {
                     showToast(data.error || 'Failed to create bot', 'error');
                 }
@@ -409,7 +562,16 @@ function setupDashboardEvents() {
                 });
                 const data = await res.json();
                 if (data.success) {
-                    showToast('Files uploaded successfully');
+                    const changed = Object.values(data.files || {}).some(f => f.changed);
+                    showToast(changed ? 'Files uploaded successfully' : 'Files unchanged');
+                    Object.entries(data.files || {}).forEach(([name, f]) => {
+                        (f.warnings || []).forEach(w => {
+                            showToast(`${name}${w.line ? ':' + w.line : ''}: ${w.message}`, 'error');
+                        });
+                    });
+                } else if (data.errors && data.errors.length) {
+                    const e = data.errors[0];
+                    showToast(`${data.error}: line ${e.line}: ${e.message}`, 'error');
                 } else {
                     showToast(data.error || 'Upload failed', 'error');
                 }
@@ -434,7 +596,7 @@ function setupDashboardEvents() {
                 const data = await res.json();
                 if (data.success) {
                     showToast('Bot started');
-                    await updateBotStatus(currentBotId);
+                    await refreshDashboard();
                 } else {
                     showToast(data.message || 'Failed to start', 'error');
                 }
@@ -457,7 +619,7 @@ function setupDashboardEvents() {
                     body: JSON.stringify({ bot_id: currentBotId })
                 });
                 showToast('Bot stopped');
-                await updateBotStatus(currentBotId);
+                await refreshDashboard();
             } catch (err) {
                 showToast('Network error', 'error');
             }
@@ -478,8 +640,13 @@ function setupDashboardEvents() {
                 });
                 const data = await res.json();
                 if (data.success) {
-                    showToast('Bot restarted');
-                    await updateBotStatus(currentBotId);
+                    const op = await waitForOperation(data.op_id);
+                    if (op && op.counts.done) {
+                        showToast('Bot restarted');
+                    } else {
+                        showToast('Restart failed', 'error');
+                    }
+                    await refreshDashboard();
                 } else {
                     showToast(data.message || 'Failed to restart', 'error');
                 }
@@ -498,12 +665,18 @@ function setupDashboardEvents() {
             const cmd = commandInput.value.trim();
             if (!cmd || !currentBotId) return;
             try {
-                await fetch(API.command, {
+                const res = await fetch(API.command, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ bot_id: currentBotId, command: cmd })
                 });
-                commandInput.value = '';
+                const data = await res.json();
+                if (data.success) {
+                    commandInput.value = '';
+                } else {
+                    const dropped = (data.commands || []).find(c => c.status === 'dropped');
+                    showToast((dropped && dropped.detail) || data.error || 'Command not delivered', 'error');
+                }
             } catch (err) {
                 showToast('Failed to send command', 'error');
             }
@@ -526,33 +699,30 @@ function setupDashboardEvents() {
     }
 }
 
-function startPolling() {
-    // Poll logs every 2 seconds
-    logsPollInterval = setInterval(() => {
-        if (currentBotId) {
-            updateLogs(currentBotId);
-        }
-    }, 2000);
-    
-    // Poll status every 5 seconds
-    statusPollInterval = setInterval(() => {
-        if (currentBotId) {
-            updateBotStatus(currentBotId);
-        }
-    }, 5000);
-    
-    // Poll resources every 5 seconds
-    resourcesPollInterval = setInterval(() => {
-        if (currentBotId) {
-            updateResources(currentBotId);
+// Poll a background operation until it finishes (or we give up)
+async function waitForOperation(opId, timeoutMs = 30000) {
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+        try {
+            const res = await fetch(`${API.operation}?op_id=${opId}`);
+            const op = await res.json();
+            if (op.done) return op;
+        } catch (err) {
+            console.error('Failed to poll operation', err);
         }
-    }, 5000);
+        await new Promise(resolve => setTimeout(resolve, 250));
+    }
+    return null;
+}
+
+function startPolling() {
+    // One conditional request every 2 seconds covers plan, bots, status,
+    // resources and the selected bot's logs; unchanged state costs a 304
+    statusPollInterval = setInterval(refreshDashboard, 2000);
 }
 
 function stopPolling() {
-    if (logsPollInterval) clearInterval(logsPollInterval);
     if (statusPollInterval) clearInterval(statusPollInterval);
-    if (resourcesPollInterval) clearInterval(resourcesPollInterval);
 }
 
 // ------------------ Admin Dashboard ------------------
@@ -571,6 +741,7 @@ async function loadAdminStats() {
         document.getElementById('total-users').textContent = data.total_users;
         document.getElementById('total-bots').textContent = data.total_bots;
         document.getElementById('running-bots').textContent = data.running_bots;
+        document.getElementById('hung-bots').textContent = data.hung_bots;
     } catch (err) {
         console.error('Failed to load admin stats', err);
     }